@@ -1,7 +1,7 @@
+from decimal import Decimal
 from core.views import BaseViewSet
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Sum, Q
 from .models import Employee, Material, MaterialCost, GeneralExpense, MonthlyLabourCost
 from .serializers import (
     EmployeeSerializer, 
@@ -11,8 +11,8 @@ from .serializers import (
     MonthlyLabourCostSerializer
 )
 
-# Import external models for aggregation
-from suppliers.models import SupplierInvoice
+# Agrégats mensuels (fournisseurs, main-d'œuvre, charges)
+from dashboard.snapshots import get_snapshot
 # Payroll might be imported differently depending on app structure check
 try:
     from payroll.models import SalaryPeriod
@@ -60,22 +60,17 @@ class GeneralExpenseViewSet(BaseViewSet):
             year = today.year
             month = today.month
 
+        # Agrégats du mois : snapshot financier (dashboard/snapshots.py)
+        snapshot = get_snapshot(year, month)
+
         # 1. Suppliers Expenses
-        suppliers_total = SupplierInvoice.objects.filter(
-            date__year=year, 
-            date__month=month
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        suppliers_total = snapshot.suppliers_total
 
         # 2. Labor Expenses - Manual Entry Only (totalement indépendant des projets)
-        manual_labour = MonthlyLabourCost.objects.filter(
-            year=year,
-            month=month
-        ).first()
-        
-        if manual_labour:
-            labor_total = manual_labour.amount
+        if snapshot.labour_entered:
+            labor_total = snapshot.labour_total
             labor_source = 'manual'
-            labor_description = manual_labour.description
+            labor_description = snapshot.labour_description
         else:
             # Aucune saisie manuelle = coût de main-d'œuvre à 0
             labor_total = 0
@@ -83,14 +78,13 @@ class GeneralExpenseViewSet(BaseViewSet):
             labor_description = None
 
         # 3. Other Expenses (GeneralExpense)
-        general_total_qs = self.queryset.filter(
-            date__year=year,
-            date__month=month
-        )
-        general_total = general_total_qs.aggregate(total=Sum('amount'))['total'] or 0
-        
+        general_total = snapshot.general_total
+
         # Breakdown by category for charts
-        breakdown = general_total_qs.values('category').annotate(total=Sum('amount'))
+        breakdown = [
+            {'category': category, 'total': Decimal(total)}
+            for category, total in sorted(snapshot.general_by_category.items())
+        ]
 
         return Response({
             'period': {'month': month, 'year': year},
@@ -0,0 +1,257 @@
+"""
+Benchmark des endpoints PDF : devis, bon de livraison, facture et rapport mensuel fournisseurs.
+
+    python manage.py benchmark_pdf --sizes 10,100,1000,10000 --repeat 3 --output bench_pdf.json
+
+Les données synthétiques sont créées dans une transaction annulée en fin de benchmark
+et les PDF stockés sont écrits dans un répertoire temporaire.
+"""
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+import django
+import reportlab
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from clients.models import Client
+from documents.models import Document
+from projects.models import Project
+from quotes.models import Quote, QuoteGroup, QuoteLine
+from suppliers.models import Supplier, SupplierInvoice
+
+ENDPOINTS = ('quote_pdf', 'quote_pdf_cached', 'delivery_note', 'invoice', 'monthly_report_pdf')
+DEFAULT_SIZES = '10,100,1000,10000'
+# Mois des achats fournisseurs synthétiques (hors des données réelles)
+REPORT_YEAR, REPORT_MONTH = 1999, 1
+
+
+def current_rss():
+    """RSS courant du processus en octets (Linux), sinon pic ru_maxrss"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS:
+    """Échantillonne le RSS pendant un bloc pour en retenir le pic"""
+
+    interval = 0.005
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def synthetic_designation(i):
+    if i % 10 == 0:
+        return (f"Fourniture et pose de carrelage grès cérame 60x60 rectifié, y compris "
+                f"colle, joints et coupes - zone {i}")
+    if i % 25 == 0:
+        return f"Enduit <b>hydrofuge</b> façade & soubassement - lot {i}"
+    return f"Fourniture et pose carrelage 60x60 - lot {i}"
+
+
+class Command(BaseCommand):
+    help = "Benchmark de la génération PDF (temps, requêtes SQL, pic RSS, taille) sur des devis synthétiques"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help="Nombres de lignes des devis synthétiques (séparés par des virgules)")
+        parser.add_argument('--groups', type=int, default=10,
+                            help="Nombre de QuoteGroup pour la variante groupée (0 = pas de variante groupée)")
+        parser.add_argument('--repeat', type=int, default=3, help="Nombre d'exécutions par cas")
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f"Endpoints à mesurer parmi : {', '.join(ENDPOINTS)}")
+        parser.add_argument('--output', help="Fichier JSON des résultats")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size]
+        except ValueError:
+            raise CommandError("--sizes doit être une liste d'entiers")
+        endpoints = [e for e in options['endpoints'].split(',') if e]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Endpoints inconnus : {', '.join(sorted(unknown))}")
+        group_variants = [0, options['groups']] if options['groups'] > 0 else [0]
+        self.repeat = max(1, options['repeat'])
+
+        results = []
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root,
+            ALLOWED_HOSTS=['*'],
+            # Données du benchmark dans une transaction annulée : écriture synchrone des PDF,
+            # sans quoi quote_pdf_cached ne trouverait jamais de document stocké
+            PDF_WRITE_BEHIND=False,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+        ):
+            with transaction.atomic():
+                self.client = self._api_client()
+                for size in sizes:
+                    for groups in group_variants:
+                        quote = self._make_quote(size, groups)
+                        for endpoint in endpoints:
+                            if endpoint != 'monthly_report_pdf':
+                                results.append(self._run_case(endpoint, size, groups, quote))
+                    if 'monthly_report_pdf' in endpoints:
+                        self._make_supplier_invoices(size)
+                        results.append(self._run_case('monthly_report_pdf', size, None))
+                transaction.set_rollback(True)
+
+        self._print_summary(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'environment': self._environment(), 'results': results}, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
+
+    # --- Données synthétiques ---
+
+    def _api_client(self):
+        user = User.objects.create_superuser('benchmark_pdf', 'benchmark@example.com', None)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def _make_quote(self, size, groups):
+        client, _ = Client.objects.get_or_create(
+            nom_client='Client Benchmark', defaults={'adresse': 'Zone industrielle', 'ice': '001234567000089'}
+        )
+        project = Project.objects.create(
+            nom_projet=f'Benchmark {size} lignes', date_debut=datetime.date(REPORT_YEAR, 1, 1),
+            budget_total=Decimal('1000000'), client=client
+        )
+        quote = Quote.objects.create(
+            numero_devis=f'BENCH-{size}-{groups}', objet=f'Benchmark {size} lignes',
+            date_livraison=datetime.date(REPORT_YEAR, 1, 31), project=project,
+            tva=Decimal('20'), remise=Decimal('5')
+        )
+        quote_groups = QuoteGroup.objects.bulk_create(
+            [QuoteGroup(quote=quote, name=f'Lot {g + 1}', order=g) for g in range(groups)]
+        )
+        lines = []
+        for i in range(size):
+            quantite = i % 50 + 1
+            prix_unitaire = Decimal(100 + i % 400) / 4
+            lines.append(QuoteLine(
+                quote=quote,
+                group=quote_groups[i * groups // size] if quote_groups else None,
+                designation=synthetic_designation(i),
+                quantite=quantite,
+                prix_unitaire=prix_unitaire,
+                montant_ht=quantite * prix_unitaire,
+            ))
+        QuoteLine.objects.bulk_create(lines, batch_size=1000)
+        quote.calculate_totals()
+        return quote
+
+    def _make_supplier_invoices(self, size):
+        SupplierInvoice.objects.filter(date__year=REPORT_YEAR, date__month=REPORT_MONTH).delete()
+        suppliers = Supplier.objects.bulk_create(
+            [Supplier(name=f'Fournisseur {s + 1:04d}') for s in range(max(1, size // 10))]
+        )
+        SupplierInvoice.objects.bulk_create([
+            SupplierInvoice(
+                supplier=suppliers[i % len(suppliers)],
+                date=datetime.date(REPORT_YEAR, REPORT_MONTH, i % 28 + 1),
+                amount=Decimal(1000 + i % 9000) / 10,
+            )
+            for i in range(size)
+        ], batch_size=1000)
+
+    # --- Mesures ---
+
+    def _request(self, endpoint, quote):
+        if endpoint == 'quote_pdf':
+            # Invalide le PDF stocké pour mesurer un rendu complet
+            Document.objects.filter(project=quote.project).update(fingerprint=None)
+            return self.client.get(f'/api/quotes/{quote.pk}/pdf/')
+        if endpoint == 'quote_pdf_cached':
+            return self.client.get(f'/api/quotes/{quote.pk}/pdf/')
+        if endpoint == 'delivery_note':
+            return self.client.post(f'/api/quotes/{quote.pk}/generate-delivery-note/',
+                                    {'bl_number': f'BL-{quote.numero_devis}'}, format='json')
+        if endpoint == 'invoice':
+            return self.client.post(f'/api/quotes/{quote.pk}/generate-invoice/',
+                                    {'invoice_number': f'FAC-{quote.numero_devis}'}, format='json')
+        return self.client.get('/api/suppliers/invoices/monthly-report-pdf/',
+                               {'year': REPORT_YEAR, 'month': REPORT_MONTH})
+
+    def _run_case(self, endpoint, size, groups, quote=None):
+        times, queries, peaks = [], [], []
+        status = output_bytes = None
+        for _ in range(self.repeat):
+            with PeakRSS() as rss, CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self._request(endpoint, quote)
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                elapsed = time.perf_counter() - started
+            times.append(round(elapsed * 1000, 2))
+            queries.append(len(captured))
+            peaks.append(rss.peak)
+            status, output_bytes = response.status_code, len(content)
+
+        result = {
+            'endpoint': endpoint,
+            'lines': size,
+            'groups': groups,
+            'status': status,
+            'runs': self.repeat,
+            'wall_ms': {'min': min(times), 'median': statistics.median(times), 'max': max(times), 'all': times},
+            'queries': {'first': queries[0], 'median': statistics.median(queries)},
+            'peak_rss_mb': round(max(peaks) / 1024 / 1024, 1),
+            'output_bytes': output_bytes,
+        }
+        self.stdout.write(
+            f"{endpoint:<20} lines={size:<6} groups={str(groups):<4} "
+            f"median={result['wall_ms']['median']:>9.1f}ms queries={queries[0]:<6} "
+            f"rss={result['peak_rss_mb']:>7.1f}MB size={output_bytes}"
+        )
+        return result
+
+    def _print_summary(self, results):
+        failed = [r for r in results if r['status'] != 200]
+        for r in failed:
+            self.stderr.write(f"{r['endpoint']} lines={r['lines']} groups={r['groups']} : HTTP {r['status']}")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} cas mesurés, {len(failed)} en erreur"))
+
+    def _environment(self):
+        return {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'reportlab': reportlab.Version,
+            'database': connection.vendor,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': self.repeat,
+        }
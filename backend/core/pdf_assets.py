@@ -0,0 +1,71 @@
+"""
+Cache process-wide des images de la charte graphique (en-tête, pied de page, signature).
+
+Chaque image est décodée une seule fois par worker puis réutilisée par tous les
+générateurs PDF ReportLab. Elle n'est rechargée que si le mtime du fichier change.
+"""
+import os
+import threading
+from django.conf import settings
+from reportlab.lib.utils import ImageReader
+
+HEADER_IMAGE = 'entete.png'
+FOOTER_IMAGE = 'newfooter.png'
+SIGNATURE_IMAGE = 'signature.jpeg'
+
+
+def branding_path(filename):
+    return os.path.join(settings.BASE_DIR, 'static', 'images', filename)
+
+
+class BrandingAsset:
+    """Image décodée avec ses dimensions et son ratio (hauteur / largeur)"""
+
+    def __init__(self, path, mtime, reader):
+        self.path = path
+        self.mtime = mtime
+        self.reader = reader
+        self.width, self.height = reader.getSize()
+        self.aspect = self.height / float(self.width)
+
+    def height_for_width(self, width):
+        return width * self.aspect
+
+
+_assets = {}
+_lock = threading.Lock()
+
+
+def _load(path, mtime):
+    reader = ImageReader(path)
+    # Décoder immédiatement (et le masque alpha éventuel) pour que les
+    # lectures concurrentes ne fassent plus aucun travail.
+    reader.getRGBData()
+    if reader._dataA is not None:
+        reader._dataA.getRGBData()
+    return BrandingAsset(path, mtime, reader)
+
+
+def get_branding_asset(filename):
+    """Retourne l'image de charte en cache, ou None si le fichier est absent ou illisible."""
+    path = branding_path(filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        _assets.pop(path, None)
+        return None
+
+    asset = _assets.get(path)
+    if asset is not None and asset.mtime == mtime:
+        return asset
+
+    with _lock:
+        asset = _assets.get(path)
+        if asset is None or asset.mtime != mtime:
+            try:
+                asset = _load(path, mtime)
+            except Exception as e:
+                print(f"Error loading branding asset {filename}: {e}")
+                return None
+            _assets[path] = asset
+    return asset
@@ -0,0 +1,433 @@
+"""
+Moteur de rendu PDF commun (devis, bons de livraison, factures, rapports fournisseurs).
+
+Les styles de paragraphe, les TableStyle et le cadre de page (en-tête / pied de page)
+sont construits une seule fois par processus puis partagés entre les requêtes :
+ils ne doivent jamais être modifiés après leur création.
+"""
+import io
+import threading
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Flowable
+from .pdf_assets import get_branding_asset, HEADER_IMAGE, FOOTER_IMAGE, SIGNATURE_IMAGE
+
+# Charte graphique
+COLOR_PRIMARY = colors.HexColor('#0095C8') # Blue
+COLOR_SECONDARY = colors.HexColor('#D01C2B') # Red
+COLOR_TEXT = colors.HexColor('#2c3e50')
+COLOR_LIGHT_GRAY = colors.HexColor('#f8f9fa')
+COLOR_GROUP_BACKGROUND = colors.HexColor('#ecf0f1')
+COLOR_GRID = colors.HexColor('#bdc3c7')
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+# Largeur utile (marges gauche/droite de 30)
+AVAILABLE_WIDTH = PAGE_WIDTH - 60
+
+_sample_styles = getSampleStyleSheet()
+
+NORMAL_STYLE = ParagraphStyle(
+    'DocumentNormal', parent=_sample_styles['Normal'],
+    fontSize=10, textColor=COLOR_TEXT
+)
+TITLE_STYLE = ParagraphStyle(
+    'DocumentTitle', parent=_sample_styles['Heading1'],
+    fontSize=16, textColor=COLOR_PRIMARY, alignment=1  # Center
+)
+
+INFO_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (0, 0), 0),   # Left col padding
+    ('LEFTPADDING', (1, 0), (1, 0), 20),  # Right col padding
+])
+
+LINE_TABLE_STYLE = TableStyle([
+    # Header Row
+    ('BACKGROUND', (0, 0), (-1, 0), COLOR_PRIMARY),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+    ('TOPPADDING', (0, 0), (-1, 0), 10),
+
+    # General Data Rows
+    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'), # Numbers right aligned
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.5, COLOR_GRID), # Fine borders
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+
+    # Désignations en texte brut : même rendu que NORMAL_STYLE
+    ('FONTSIZE', (0, 1), (0, -1), NORMAL_STYLE.fontSize),
+    ('LEADING', (0, 1), (0, -1), NORMAL_STYLE.leading),
+    ('TEXTCOLOR', (0, 1), (0, -1), COLOR_TEXT),
+])
+
+LINE_COL_WIDTHS = [AVAILABLE_WIDTH * 0.55, AVAILABLE_WIDTH * 0.1, AVAILABLE_WIDTH * 0.15, AVAILABLE_WIDTH * 0.2]
+
+# Au-delà de ce nombre de lignes, le tableau est mis en page par morceaux (mode grand document)
+LARGE_TABLE_ROWS = 200
+# Fenêtre de lignes mises en page à la fois en mode grand document : un peu plus
+# qu'une page, puis réajustée sur le nombre de lignes réellement placées par page
+TABLE_CHUNK_ROWS = 60
+TABLE_CHUNK_MARGIN = 10
+# Largeur de texte d'une cellule de désignation (paddings par défaut de 6 de chaque côté)
+DESIGNATION_TEXT_WIDTH = LINE_COL_WIDTHS[0] - 12
+
+TOTALS_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (-1, -1), COLOR_TEXT),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+
+    # Total TTC Highlight (Last Row)
+    ('TEXTCOLOR', (0, -1), (-1, -1), COLOR_TEXT),
+    ('FONTSIZE', (0, -1), (-1, -1), 11),
+    ('LINEABOVE', (0, -1), (-1, -1), 1, COLOR_PRIMARY),
+    ('BACKGROUND', (0, -1), (-1, -1), COLOR_GROUP_BACKGROUND),
+])
+
+STAMP_SIGNATURE_STYLE = TableStyle([
+    ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+CLIENT_SIGNATURE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+])
+
+PROVIDER_SIGNATURE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+])
+
+SIGNATURES_LAYOUT_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+    ('ALIGN', (1, 0), (1, 0), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+
+class PageFramework:
+    """Marges du document et dessin de l'en-tête / pied de page sur chaque page"""
+
+    def __init__(self, header, footer):
+        self.header = header
+        self.footer = footer
+
+        header_height_reserved = 0
+        footer_height_reserved = 50
+        if header:
+            # Keep logo professional size (approx 60% of content width)
+            header_height_reserved = header.height_for_width(AVAILABLE_WIDTH * 0.6) + 20
+        if footer:
+            # Footer is usually 90% of page width
+            footer_height_reserved = footer.height_for_width(PAGE_WIDTH * 0.9) + 20
+
+        self.top_margin = max(30, header_height_reserved + 10)
+        self.bottom_margin = max(50, footer_height_reserved + 10)
+
+    def __call__(self, canvas, doc):
+        canvas.saveState()
+
+        # Draw Header (Fixed Position Top)
+        if self.header:
+            try:
+                target_width_h = AVAILABLE_WIDTH * 0.6
+                target_height_h = self.header.height_for_width(target_width_h)
+                x = (PAGE_WIDTH - target_width_h) / 2
+                y = PAGE_HEIGHT - target_height_h - 10 # 10 padding from top
+                canvas.drawImage(self.header.reader, x, y, width=target_width_h, height=target_height_h, mask='auto', preserveAspectRatio=True)
+            except Exception as e:
+                print(f"Error drawing header on page: {e}")
+
+        # Draw Footer (Fixed Position Bottom)
+        if self.footer:
+            try:
+                target_width_f = PAGE_WIDTH * 0.9
+                target_height_f = self.footer.height_for_width(target_width_f)
+                x = (PAGE_WIDTH - target_width_f) / 2
+                y = 10
+                canvas.drawImage(self.footer.reader, x, y, width=target_width_f, height=target_height_f, mask='auto', preserveAspectRatio=True)
+            except Exception as e:
+                print(f"Error drawing footer on page: {e}")
+
+        canvas.restoreState()
+
+
+_framework = None
+_framework_lock = threading.Lock()
+
+
+def get_page_framework():
+    """Cadre de page partagé, reconstruit uniquement si une image de charte a changé"""
+    global _framework
+    header = get_branding_asset(HEADER_IMAGE)
+    footer = get_branding_asset(FOOTER_IMAGE)
+    framework = _framework
+    if framework is None or framework.header is not header or framework.footer is not footer:
+        with _framework_lock:
+            framework = PageFramework(header, footer)
+            _framework = framework
+    return framework
+
+
+def render_story(elements):
+    """Construit le PDF A4 (avec en-tête et pied de page) et retourne son contenu binaire"""
+    framework = get_page_framework()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=30, leftMargin=30,
+        topMargin=framework.top_margin,
+        bottomMargin=framework.bottom_margin
+    )
+    doc.build(elements, onFirstPage=framework, onLaterPages=framework)
+    return buffer.getvalue()
+
+
+class LineSection:
+    """Section du tableau de lignes : titre de groupe optionnel, lignes et sous-total optionnel"""
+
+    def __init__(self, rows, title=None, subtotal=None):
+        # rows: tuples (designation, quantite, prix_unitaire, montant_ht)
+        self.rows = rows
+        self.title = title
+        self.subtotal = subtotal
+
+
+class LineDocument:
+    """Modèle d'un document à lignes (devis, BL, facture), indépendant de l'ORM"""
+
+    SIGNATURE_STAMP = 'stamp'      # Signature scannée de l'entreprise (devis)
+    SIGNATURE_PARTIES = 'parties'  # Emplacements client / prestataire (BL, facture)
+
+    def __init__(self, info_left, info_right, sections, totals,
+                 price_headers=('P.U. (DH)', 'Total (DH)'), closing_text=None,
+                 signature=SIGNATURE_STAMP):
+        self.info_left = info_left
+        self.info_right = info_right
+        self.sections = sections
+        self.totals = totals
+        self.price_headers = price_headers
+        self.closing_text = closing_text
+        self.signature = signature
+
+
+def totals_rows(remise, tva, total_ht_gross, montant_remise, total_ht_net, tva_amount, total_ttc):
+    """Lignes du bloc des totaux (le détail de la remise n'apparaît que si elle existe)"""
+    rows = []
+    if remise and remise > 0:
+        rows.append(['Total HT', f"{total_ht_gross:,.2f} DH"])
+        rows.append([f'Remise ({remise:g}%)', f"-{montant_remise:,.2f} DH"])
+        rows.append(['Total HT Net', f"{total_ht_net:,.2f} DH"])
+    else:
+        rows.append(['Total HT', f"{total_ht_net:,.2f} DH"])
+    rows.append([f'TVA ({tva}%)', f"{tva_amount:,.2f} DH"])
+    rows.append(['Total TTC', f"{total_ttc:,.2f} DH"])
+    return rows
+
+
+def designation_cell(designation):
+    """
+    Cellule de désignation : chaîne brute si le texte n'a pas de balisage et tient sur
+    une ligne (pas de Paragraph à mettre en page), sinon Paragraph.
+    """
+    text = " ".join(str(designation or "").split())
+    if '<' in text or '&' in text:
+        return Paragraph(designation, NORMAL_STYLE)
+    if stringWidth(text, NORMAL_STYLE.fontName, NORMAL_STYLE.fontSize) > DESIGNATION_TEXT_WIDTH:
+        return Paragraph(text, NORMAL_STYLE)
+    return text
+
+
+# Types de lignes du tableau (pour les commandes de style)
+ROW_LINE = 'line'
+ROW_GROUP = 'group'
+ROW_SUBTOTAL = 'subtotal'
+
+
+def line_table(header, rows):
+    """Table des lignes : en-tête (répété à chaque page) puis rows = [(kind, cells)]"""
+    section_cmds = []
+    for index, (kind, _) in enumerate(rows, start=1):
+        if kind == ROW_GROUP:
+            section_cmds.append(('SPAN', (0, index), (-1, index)))
+            section_cmds.append(('BACKGROUND', (0, index), (-1, index), COLOR_GROUP_BACKGROUND))
+            section_cmds.append(('ALIGN', (0, index), (-1, index), 'LEFT'))
+        elif kind == ROW_SUBTOTAL:
+            section_cmds.append(('FONTNAME', (2, index), (3, index), 'Helvetica-Bold'))
+
+    table = Table([header] + [cells for _, cells in rows], colWidths=LINE_COL_WIDTHS, repeatRows=1)
+    table.setStyle(LINE_TABLE_STYLE)
+    if section_cmds:
+        table.setStyle(TableStyle(section_cmds))
+    return table
+
+
+class ChunkedLineTable(Flowable):
+    """
+    Tableau de lignes des grands documents.
+
+    Une Table ReportLab recalcule hauteurs et fusions de toutes les lignes restantes à
+    chaque saut de page (coût quadratique) : ici seule une fenêtre de TABLE_CHUNK_ROWS
+    lignes est mise en page à la fois, le reste est reporté dans un nouveau morceau.
+    """
+
+    def __init__(self, header, rows, chunk_rows=TABLE_CHUNK_ROWS):
+        Flowable.__init__(self)
+        self.header = header
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+        self._table = None
+
+    def wrap(self, availWidth, availHeight):
+        if len(self.rows) > self.chunk_rows:
+            # Plus d'une page de lignes : le cadre doit découper ce morceau
+            self._table = None
+            self.width, self.height = sum(LINE_COL_WIDTHS), availHeight + 1
+        else:
+            self._table = line_table(self.header, self.rows)
+            self.width, self.height = self._table.wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        count = self.chunk_rows
+        while True:
+            table = line_table(self.header, self.rows[:count])
+            parts = table.split(availWidth, availHeight)
+            if not parts:
+                return []
+            if len(parts) > 1:
+                break
+            if count >= len(self.rows):
+                return parts
+            # La fenêtre tient entièrement dans l'espace disponible : l'élargir
+            count *= 2
+
+        # La fenêtre suivante est dimensionnée sur le nombre de lignes de cette page
+        consumed = parts[0]._nrows - 1
+        return [parts[0], ChunkedLineTable(self.header, self.rows[consumed:], consumed + TABLE_CHUNK_MARGIN)]
+
+    def draw(self):
+        self._table.drawOn(self.canv, 0, 0)
+
+
+def build_line_table(sections, price_headers):
+    header = ['Désignation', 'Qté', *price_headers]
+    rows = []
+
+    for section in sections:
+        if section.title is not None:
+            rows.append((ROW_GROUP, [Paragraph(f"<b>{section.title}</b>", NORMAL_STYLE), "", "", ""]))
+
+        for designation, quantite, prix_unitaire, montant_ht in section.rows:
+            rows.append((ROW_LINE, [
+                designation_cell(designation),
+                str(quantite),
+                f"{prix_unitaire:,.2f}",
+                f"{montant_ht:,.2f}"
+            ]))
+
+        if section.subtotal is not None:
+            rows.append((ROW_SUBTOTAL, ["", "", "S/Total", f"{section.subtotal:,.2f}"]))
+
+    if len(rows) > LARGE_TABLE_ROWS:
+        return ChunkedLineTable(header, rows)
+    return line_table(header, rows)
+
+
+class BrandingImage(Flowable):
+    """Image de charte en cache (voir core/pdf_assets.py), dessinée sans relire ni décoder le fichier"""
+
+    def __init__(self, asset, width):
+        Flowable.__init__(self)
+        self.asset = asset
+        self.width = width
+        self.height = asset.height_for_width(width)
+        self.hAlign = 'CENTER'
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.drawImage(self.asset.reader, 0, 0, width=self.width, height=self.height, mask='auto')
+
+
+def _stamp_signature():
+    signature = get_branding_asset(SIGNATURE_IMAGE)
+    signature_content = [Paragraph("<b>Signature</b>", NORMAL_STYLE)]
+    if signature:
+        signature_content.append(BrandingImage(signature, width=120))
+
+    table = Table([[None, signature_content]], colWidths=[AVAILABLE_WIDTH - 150, 150])
+    table.setStyle(STAMP_SIGNATURE_STYLE)
+    return table
+
+
+def _parties_signatures():
+    client_sig_table = Table([[[
+        Paragraph("<b>Signature du Client :</b>", NORMAL_STYLE),
+        Spacer(1, 40)
+    ]]], colWidths=[200])
+    client_sig_table.setStyle(CLIENT_SIGNATURE_STYLE)
+
+    provider_sig_table = Table([[[
+        Paragraph("<b>Signature du Prestataire :</b>", NORMAL_STYLE),
+        Spacer(1, 40)
+    ]]], colWidths=[200])
+    provider_sig_table.setStyle(PROVIDER_SIGNATURE_STYLE)
+
+    # Layout: Client Left, Provider Right
+    table = Table([[client_sig_table, provider_sig_table]], colWidths=[AVAILABLE_WIDTH / 2, AVAILABLE_WIDTH / 2])
+    table.setStyle(SIGNATURES_LAYOUT_STYLE)
+    return table
+
+
+def render_line_document(document):
+    """Rend un LineDocument en PDF et retourne son contenu binaire"""
+    elements = []
+
+    # --- Info Block (2 Columns) ---
+    info_table = Table([[
+        [Paragraph(text, NORMAL_STYLE) for text in document.info_left],
+        [Paragraph(text, NORMAL_STYLE) for text in document.info_right],
+    ]], colWidths=[AVAILABLE_WIDTH / 2, AVAILABLE_WIDTH / 2])
+    info_table.setStyle(INFO_TABLE_STYLE)
+    elements.append(info_table)
+    elements.append(Spacer(1, 20))
+
+    # --- Lines Table ---
+    elements.append(build_line_table(document.sections, document.price_headers))
+    elements.append(Spacer(1, 15))
+
+    # --- Totals (placed to the right) ---
+    totals_table = Table(document.totals, colWidths=[100, 120])
+    totals_table.setStyle(TOTALS_TABLE_STYLE)
+    elements.append(Table([[None, totals_table]], colWidths=[AVAILABLE_WIDTH - 220, 220]))
+
+    # --- Closing text & Signatures ---
+    if document.signature == LineDocument.SIGNATURE_STAMP:
+        elements.append(Spacer(1, 30))
+        if document.closing_text:
+            elements.append(Paragraph(document.closing_text, NORMAL_STYLE))
+            elements.append(Spacer(1, 30))
+        elements.append(_stamp_signature())
+    else:
+        if document.closing_text:
+            elements.append(Spacer(1, 15))
+            elements.append(Paragraph(document.closing_text, NORMAL_STYLE))
+            elements.append(Spacer(1, 20))
+        else:
+            elements.append(Spacer(1, 30))
+        elements.append(_parties_signatures())
+
+    return render_story(elements)
@@ -0,0 +1,121 @@
+"""
+Export groupé de PDF : rendu en parallèle dans un pool de processus et archive ZIP
+envoyée en streaming au fur et à mesure que les fichiers sont prêts.
+"""
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from .pdf_engine import render_line_document
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def export_workers():
+    """Nombre de processus de rendu (0 = rendu séquentiel dans le processus courant)"""
+    return getattr(settings, 'PDF_EXPORT_WORKERS', min(4, os.cpu_count() or 1))
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn : pas de fork d'un worker multithreadé (threads gunicorn, DocumentWriter)
+            _pool = ProcessPoolExecutor(max_workers=export_workers(), mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class _ZipStream(io.RawIOBase):
+    """Flux non positionnable : zipfile y écrit, le générateur vide les octets produits"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _unique_name(name, used):
+    name = name.replace('/', '-').replace('\\', '-')
+    base, ext = os.path.splitext(name)
+    candidate, index = name, 1
+    while candidate in used:
+        index += 1
+        candidate = f"{base}_{index}{ext}"
+    used.add(candidate)
+    return candidate
+
+
+def _rendered(jobs):
+    """Produit (arcname, pdf_content) dans l'ordre de fin de rendu, avec un nombre borné de rendus en vol"""
+    workers = export_workers()
+    if workers <= 0:
+        for arcname, document in jobs:
+            yield arcname, render_line_document(document)
+        return
+
+    pool = _get_pool()
+    max_in_flight = workers * 2
+    pending = {}
+    jobs = iter(jobs)
+    exhausted = False
+    try:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    arcname, document = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(render_line_document, document)] = arcname
+
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                arcname = pending.pop(future)
+                yield arcname, future.result()
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def stream_pdf_zip(jobs):
+    """
+    Générateur d'octets d'une archive ZIP.
+
+    jobs: itérable de (nom_de_fichier, LineDocument) ; les documents sont rendus
+    en parallèle et chaque PDF est écrit dans l'archive dès qu'il est prêt.
+    """
+    stream = _ZipStream()
+    used_names = set()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for arcname, pdf_content in _rendered(jobs):
+            archive.writestr(_unique_name(arcname, used_names), pdf_content)
+            yield stream.pop()
+    yield stream.pop()
@@ -28,6 +28,8 @@ class RBACPermission(permissions.BasePermission):
             'partial_update': 'can_update',
             'destroy': 'can_delete',
         }
+        # Actions personnalisées soumises à une permission (ex: {'download': 'can_read'})
+        action_map.update(getattr(view, 'rbac_actions', {}))
         
         required_permission = action_map.get(view.action)
         if not required_permission:
@@ -0,0 +1,26 @@
+class DynamicFieldsMixin:
+    """
+    Sélection des champs d'un serializer à la construction :
+    - fields : champs à conserver (ex. ?fields=id_quote,numero_devis)
+    - expand : relations à ajouter parmi `expandable_fields` (ex. ?expand=lines,groups)
+    Les noms inconnus sont ignorés.
+    """
+    # nom -> fabrique du champ imbriqué
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = [name for name in expand or () if name in self.expandable_fields]
+        for name in expand:
+            self.fields[name] = self.expandable_fields[name]()
+        if fields:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+
+
+def query_param_list(request, name):
+    """Paramètre de requête "a,b,c" -> ['a', 'b', 'c'] (None si absent)"""
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
@@ -0,0 +1,75 @@
+"""
+Cache des KPI du tableau de bord (cache Django, Redis en production).
+
+La réponse est mise en cache par période et granularité de l'évolution, sous la version
+courante : toute écriture sur un modèle contributeur incrémente la version
+(dashboard/signals.py), les entrées précédentes ne sont plus lues et expirent.
+KPI_CACHE_TIMEOUT borne la péremption si une invalidation est manquée
+(écritures en masse, SQL direct). Cache indisponible = calcul direct.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .kpis import compute_kpis
+
+VERSION_KEY = 'dashboard:kpis:version'
+HITS_KEY = 'dashboard:kpis:hits'
+MISSES_KEY = 'dashboard:kpis:misses'
+
+
+def kpis_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Départ horodaté : une version perdue (redémarrage, éviction) ne réutilise pas d'anciennes clés
+        cache.add(VERSION_KEY, int(time.time()), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_kpis_version():
+    """Invalide les KPI en cache (appelé au commit des écritures contributrices)"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Clé absente : la prochaine lecture repart d'une nouvelle version
+        cache.add(VERSION_KEY, int(time.time()), timeout=None)
+    except Exception as e:
+        print(f"Error invalidating KPI cache: {e}")
+
+
+def _count(key):
+    if not cache.add(key, 1, timeout=None):
+        cache.incr(key)
+
+
+def get_kpis(start, end, granularity='month'):
+    """KPI du tableau de bord, servis depuis le cache tant que la version n'a pas changé"""
+    key = f'dashboard:kpis:{granularity}:{start.isoformat()}:{end.isoformat()}'
+    try:
+        version = kpis_version()
+        payload = cache.get(key, version=version)
+        _count(HITS_KEY if payload is not None else MISSES_KEY)
+    except Exception as e:
+        print(f"KPI cache unavailable: {e}")
+        return compute_kpis(start, end, granularity)
+    if payload is None:
+        payload = compute_kpis(start, end, granularity)
+        try:
+            cache.set(key, payload, settings.KPI_CACHE_TIMEOUT, version=version)
+        except Exception as e:
+            print(f"KPI cache unavailable: {e}")
+    return payload
+
+
+def kpis_cache_stats():
+    values = cache.get_many([HITS_KEY, MISSES_KEY, VERSION_KEY])
+    hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        'version': values.get(VERSION_KEY),
+        'timeout': settings.KPI_CACHE_TIMEOUT,
+    }
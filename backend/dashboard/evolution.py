@@ -0,0 +1,178 @@
+"""
+Séries d'évolution du tableau de bord sur une période et une granularité au choix
+(semaine, mois, trimestre, année), en un nombre fixe de requêtes groupées :
+ - mois, trimestre, année : snapshots mensuels (dashboard/snapshots.py) cumulés par période,
+   plus une requête groupée sur les projets actifs (hors mois, un projet n'est compté
+   qu'une fois par période)
+ - semaine : une somme groupée par semaine pour les devis, achats et charges ; la
+   main-d'œuvre mensuelle est répartie au prorata des jours
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncWeek
+
+from budget.models import GeneralExpense, MonthlyLabourCost
+from projects.models import Project, active_during
+from quotes.models import Quote
+from suppliers.models import SupplierInvoice
+
+from .snapshots import BILLING_FIELDS, get_snapshots, month_bounds, month_index, months_between
+
+GRANULARITIES = ('week', 'month', 'quarter', 'year')
+# Nombre de points maximal d'une série (10 ans par semaine)
+MAX_PERIODS = 530
+AMOUNT_FIELDS = ('quotes_amount', 'suppliers_total', 'labour_total', 'general_total')
+
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    return date(day.year, 1, 1)
+
+
+def next_period(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'year':
+        return date(start.year + 1, 1, 1)
+    step = 1 if granularity == 'month' else 3
+    index = month_index(start.year, start.month) + step
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def period_count(start, end, granularity):
+    """Nombre de périodes couvrant [start, end], sans les construire"""
+    start, end = period_start(start, granularity), period_start(end, granularity)
+    if granularity == 'week':
+        return (end - start).days // 7 + 1
+    if granularity == 'year':
+        return end.year - start.year + 1
+    months = month_index(end.year, end.month) - month_index(start.year, start.month)
+    return months // (1 if granularity == 'month' else 3) + 1
+
+
+def periods(start, end, granularity):
+    """[(début, fin)] des périodes calendaires couvrant [start, end]"""
+    bounds = []
+    current = period_start(start, granularity)
+    while current <= end:
+        following = next_period(current, granularity)
+        bounds.append((current, following - timedelta(days=1)))
+        current = following
+    return bounds
+
+
+def period_label(start, granularity):
+    if granularity == 'week':
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == 'month':
+        return f"{start.year}-{start.month:02d}"
+    if granularity == 'quarter':
+        return f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+    return str(start.year)
+
+
+def _active_budgets(bounds):
+    """Budget des projets actifs (statuts facturables) par période, en une requête groupée"""
+    starts = [start for start, _ in bounds]
+    ends = [end for _, end in bounds]
+    totals = [Decimal(0)] * len(bounds)
+    rows = Project.objects.filter(active_during(starts[0], ends[-1]), billing_status__in=tuple(BILLING_FIELDS)) \
+        .order_by().values('date_debut', 'date_fin').annotate(total=Sum('budget_total'))
+    for row in rows:
+        first = bisect_left(ends, row['date_debut'])
+        last = bisect_right(starts, row['date_fin']) - 1 if row['date_fin'] else len(bounds) - 1
+        for i in range(first, last + 1):
+            totals[i] += row['total'] or 0
+    return totals
+
+
+def _monthly_values(bounds, granularity):
+    months = months_between((bounds[0][0].year, bounds[0][0].month), (bounds[-1][1].year, bounds[-1][1].month))
+    snapshots = get_snapshots(months)
+    budgets = None if granularity == 'month' else _active_budgets(bounds)
+    values = []
+    for i, (start, end) in enumerate(bounds):
+        rows = [snapshots[key] for key in months_between((start.year, start.month), (end.year, end.month))]
+        point = {field: sum((getattr(row, field) for row in rows), Decimal(0)) for field in AMOUNT_FIELDS}
+        point['quotes_count'] = sum(row.quotes_count for row in rows)
+        point['gross_margin'] = rows[0].gross_margin if budgets is None else budgets[i]
+        values.append(point)
+    return values
+
+
+def _weekly_sums(queryset, date_field, start, end, **aggregates):
+    rows = queryset.filter(**{f'{date_field}__gte': start, f'{date_field}__lte': end}) \
+        .annotate(bucket=TruncWeek(date_field)).order_by().values('bucket').annotate(**aggregates)
+    return {row['bucket']: row for row in rows}
+
+
+def _weekly_values(bounds):
+    start, end = bounds[0][0], bounds[-1][1]
+    quotes = _weekly_sums(Quote.objects, 'date_livraison', start, end, amount=Sum('total_ttc'), count=Count('pk'))
+    suppliers = _weekly_sums(SupplierInvoice.objects, 'date', start, end, amount=Sum('amount'))
+    general = _weekly_sums(GeneralExpense.objects, 'date', start, end, amount=Sum('amount'))
+    budgets = _active_budgets(bounds)
+
+    # Main-d'œuvre saisie par mois : répartie sur les semaines au prorata des jours
+    labour = [Decimal(0)] * len(bounds)
+    starts = [week_start for week_start, _ in bounds]
+    rows = MonthlyLabourCost.objects.filter(year__gte=start.year, year__lte=end.year) \
+        .order_by().values('year', 'month').annotate(amount=Sum('amount'))
+    for row in rows:
+        month_start, month_end = month_bounds(row['year'], row['month'])
+        if month_end < start or month_start > end:
+            continue
+        daily = row['amount'] / month_end.day
+        first = max(bisect_right(starts, month_start) - 1, 0)
+        for i in range(first, len(bounds)):
+            week_start, week_end = bounds[i]
+            if week_start > month_end:
+                break
+            days = (min(week_end, month_end) - max(week_start, month_start)).days + 1
+            labour[i] += daily * days
+
+    values = []
+    for i, (week_start, _) in enumerate(bounds):
+        week_quotes = quotes.get(week_start, {})
+        values.append({
+            'quotes_count': week_quotes.get('count', 0),
+            'quotes_amount': week_quotes.get('amount') or Decimal(0),
+            'suppliers_total': suppliers.get(week_start, {}).get('amount') or Decimal(0),
+            'labour_total': labour[i].quantize(Decimal('0.01')),
+            'general_total': general.get(week_start, {}).get('amount') or Decimal(0),
+            'gross_margin': budgets[i],
+        })
+    return values
+
+
+def evolution_series(start, end, granularity='month'):
+    """Points de l'évolution (marge brute, dépenses, marge nette, devis) par période de [start, end]"""
+    bounds = periods(start, end, granularity)
+    values = _weekly_values(bounds) if granularity == 'week' else _monthly_values(bounds, granularity)
+
+    series = []
+    for (period_first, period_last), point in zip(bounds, values):
+        expenses = point['suppliers_total'] + point['labour_total'] + point['general_total']
+        series.append({
+            'period': period_label(period_first, granularity),
+            'start': period_first,
+            'end': period_last,
+            'quotes_count': point['quotes_count'],
+            'quotes_amount': float(point['quotes_amount']),
+            'revenue': float(point['gross_margin']),  # Gross margin for display (replaces simple revenue)
+            'expenses': float(expenses),
+            'margin': float(point['gross_margin'] - expenses),  # Net margin
+            'suppliers_expenses': float(point['suppliers_total']),
+            'labour_expenses': float(point['labour_total']),
+            'general_expenses': float(point['general_total']),
+        })
+    return series
@@ -0,0 +1,131 @@
+"""
+Calcul des KPI du tableau de bord en un nombre fixe de requêtes, quelle que soit la
+taille de la fenêtre mensuelle :
+ - évolution sur [from, to] par semaine, mois, trimestre ou année (dashboard/evolution.py)
+ - totaux devis, fournisseurs, main-d'œuvre, charges : somme des snapshots
+ - projets : compteurs et sommes globales en une agrégation conditionnelle
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from invoices.models import Invoice
+from projects.models import Project, Revenue
+from quotes.models import Quote
+
+from .evolution import evolution_series
+from .models import MonthlyFinancialSnapshot
+
+BILLING_STATUSES = ('FACTURE', 'NON_FACTURE', 'EN_COURS')
+DEFAULT_MONTHS = 6
+MAX_MONTHS = 36
+
+
+def window_start(end, months):
+    """Premier jour de la fenêtre des `months` mois se terminant au mois de `end`"""
+    index = end.year * 12 + end.month - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _project_stats():
+    """Compteurs et sommes globales des projets en une seule requête"""
+    aggregates = {
+        'total_projects': Count('pk'),
+        'active_projects': Count('pk', filter=Q(etat_projet='EN_COURS')),
+    }
+    for status in BILLING_STATUSES:
+        aggregates[status] = Sum('budget_total', filter=Q(billing_status=status))
+    return Project.objects.aggregate(**aggregates)
+
+
+def compute_kpis(start=None, end=None, granularity='month', months=DEFAULT_MONTHS, today=None):
+    """
+    KPI du tableau de bord. L'évolution couvre [start, end] (par défaut les `months`
+    derniers mois), étendu aux périodes calendaires entières de la granularité.
+    """
+    today = today or timezone.now().date()
+    end = end or today
+    start = start or window_start(end, months)
+
+    projects = _project_stats()
+    # Les snapshots couvrent tous les mois ayant des données : leur somme vaut le total des tables
+    totals = MonthlyFinancialSnapshot.objects.aggregate(
+        quotes=Sum('quotes_amount'), suppliers=Sum('suppliers_total'),
+        labour=Sum('labour_total'), general=Sum('general_total'),
+    )
+    total_quotes_amount = totals['quotes'] or 0
+    total_invoices_amount = Invoice.objects.aggregate(Sum('montant'))['montant__sum'] or 0
+
+    # === CALCUL DE LA MARGE BRUTE (GROSS MARGIN) ===
+    billed_projects = projects['FACTURE'] or 0
+    unbilled_projects = projects['NON_FACTURE'] or 0
+    in_progress_projects = projects['EN_COURS'] or 0
+
+    # Project advances (Avances de projet)
+    project_advances = Revenue.objects.aggregate(Sum('avance'))['avance__sum'] or 0
+
+    # Gross Margin calculation (WITHOUT advances as per Revenus & Marges)
+    gross_margin = Decimal(billed_projects) + Decimal(unbilled_projects) + Decimal(in_progress_projects)
+
+    # === CALCUL DES DÉPENSES TOTALES (TOTAL EXPENSES) ===
+    # Total Expenses = Supplies + Labour costs + Operating expenses
+    suppliers_expenses = totals['suppliers'] or 0
+    labour_expenses = totals['labour'] or 0
+    general_expenses = totals['general'] or 0
+    total_expenses = Decimal(suppliers_expenses) + Decimal(labour_expenses) + Decimal(general_expenses)
+
+    # === CALCUL DE LA MARGE NETTE (NET MARGIN) ===
+    net_margin = gross_margin - total_expenses
+    total_revenue = Decimal(total_invoices_amount)
+    margin_percentage = (net_margin / gross_margin * 100) if gross_margin > 0 else 0
+
+    # Recent Activity
+    recent_projects = Project.objects.order_by('-date_debut')[:5].values('id_project', 'nom_projet', 'etat_projet', 'date_debut')
+    recent_quotes = Quote.objects.order_by('-id_quote')[:5].values('id_quote', 'numero_devis', 'total_ttc', 'date_livraison')
+
+    # Evolution sur la période demandée
+    series = evolution_series(start, end, granularity)
+    evolution = {
+        'granularity': granularity,
+        'from': series[0]['start'],
+        'to': series[-1]['end'],
+        'series': series,
+    }
+
+    kpis = {
+        'total_projects': projects['total_projects'],
+        'active_projects': projects['active_projects'],
+        'total_quotes_amount': float(total_quotes_amount),
+        'total_invoices_amount': float(total_invoices_amount),
+        # Financial data
+        'total_revenue': float(total_revenue),  # Kept for backward compatibility
+        'gross_margin': float(gross_margin),  # Marge Brute
+        'total_expenses': float(total_expenses),
+        'profit_margin': float(net_margin),  # NET MARGIN (renamed from profit_margin)
+        'net_margin': float(net_margin),  # Also provided as net_margin for clarity
+        'margin_percentage': float(margin_percentage),
+        # Breakdown
+        'project_breakdown': {
+            'billed': float(billed_projects),
+            'unbilled': float(unbilled_projects),
+            'in_progress': float(in_progress_projects),
+            'advances': float(project_advances)
+        },
+        'expenses_breakdown': {
+            'suppliers': float(suppliers_expenses),
+            'labour': float(labour_expenses),
+            'general': float(general_expenses)
+        },
+        'recent_projects': list(recent_projects),
+        'recent_quotes': list(recent_quotes),
+        'evolution': evolution,
+    }
+    if granularity == 'month':
+        # Format historique de la page Dashboard : libellé du mois sous 'month'
+        kpis['monthly_evolution'] = [
+            {'month': point['period'], **{key: value for key, value in point.items() if key not in ('period', 'start', 'end')}}
+            for point in series
+        ]
+    return kpis
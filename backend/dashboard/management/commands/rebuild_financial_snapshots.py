@@ -0,0 +1,23 @@
+"""
+Reconstruit les snapshots financiers mensuels (MonthlyFinancialSnapshot) depuis les
+tables sources.
+
+    python manage.py rebuild_financial_snapshots
+
+Les snapshots sont ensuite tenus à jour à chaque écriture (dashboard/signals.py) ;
+la reconstruction sert après des imports ou modifications en masse hors application
+(update(), SQL direct), qui ne déclenchent pas les signaux.
+"""
+from django.core.management.base import BaseCommand
+
+from dashboard.cache import bump_kpis_version
+from dashboard.snapshots import rebuild_snapshots
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les snapshots financiers mensuels du tableau de bord"
+
+    def handle(self, *args, **options):
+        months, removed = rebuild_snapshots()
+        bump_kpis_version()
+        self.stdout.write(self.style.SUCCESS(f"{months} mois recalculé(s), {removed} snapshot(s) supprimé(s)"))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyFinancialSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(verbose_name='Année')),
+                ('month', models.IntegerField(verbose_name='Mois')),
+                ('billed', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('unbilled', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('in_progress', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('advances', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('quotes_count', models.IntegerField(default=0)),
+                ('quotes_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('suppliers_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('labour_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('labour_entered', models.BooleanField(default=False)),
+                ('labour_description', models.TextField(blank=True, null=True)),
+                ('general_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('general_by_category', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'MONTHLY_FINANCIAL_SNAPSHOTS',
+                'ordering': ['year', 'month'],
+                'unique_together': {('year', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Premier remplissage des snapshots financiers mensuels depuis les tables sources
+from django.db import migrations
+
+
+def populate(apps, schema_editor):
+    from dashboard.snapshots import rebuild_snapshots
+    rebuild_snapshots(registry=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        ('projects', '0011_project_activity'),
+        ('quotes', '0020_quote_catalog'),
+        ('budget', '0008_remove_monthlylabourcost_unique_year_month'),
+        ('suppliers', '0002_supplierinvoice'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from django.db import models
+
+
+class MonthlyFinancialSnapshot(models.Model):
+    """
+    Agrégats financiers d'un mois (table de faits) lus par le tableau de bord,
+    Project.financial_overview et GeneralExpense.monthly_dashboard.
+    Tenue à jour par dashboard/signals.py, reconstruite par rebuild_financial_snapshots.
+    """
+    year = models.IntegerField(verbose_name="Année")
+    month = models.IntegerField(verbose_name="Mois")  # 1-12
+
+    # Projets actifs sur le mois, par statut de facturation
+    billed = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    unbilled = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    in_progress = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Avances (Revenue) des projets actifs sur le mois
+    advances = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    # Devis livrés dans le mois
+    quotes_count = models.IntegerField(default=0)
+    quotes_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    suppliers_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    labour_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    labour_entered = models.BooleanField(default=False)  # Saisie MonthlyLabourCost présente
+    labour_description = models.TextField(blank=True, null=True)
+    general_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    general_by_category = models.JSONField(default=dict)  # catégorie -> montant (chaîne décimale)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'MONTHLY_FINANCIAL_SNAPSHOTS'
+        ordering = ['year', 'month']
+        unique_together = [['year', 'month']]
+
+    def __str__(self):
+        return f"{self.year}-{self.month:02d}"
+
+    @property
+    def gross_margin(self):
+        return self.billed + self.unbilled + self.in_progress
+
+    @property
+    def total_expenses(self):
+        return self.suppliers_total + self.labour_total + self.general_total
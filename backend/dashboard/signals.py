@@ -0,0 +1,86 @@
+"""
+Mise à jour incrémentale des snapshots financiers mensuels (voir dashboard/snapshots.py).
+
+Chaque modèle source déclare sa famille d'agrégats, les champs qui situent la ligne
+dans le temps et ceux qui entrent dans les montants. Un enregistrement qui ne touche
+aucun de ces champs (update_fields) ne déclenche rien ; un changement de période
+rafraîchit l'ancienne et la nouvelle.
+
+Les mêmes écritures (et les factures) invalident le cache des KPI (dashboard/cache.py),
+après le recalcul des snapshots. Snapshots et version des KPI sont mis à jour une seule
+fois par transaction, quel que soit le nombre d'écritures.
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from budget.models import GeneralExpense, MonthlyLabourCost
+from invoices.models import Invoice
+from projects.models import Project, Revenue
+from quotes.models import Quote
+from suppliers.models import SupplierInvoice
+
+from .cache import bump_kpis_version
+from .snapshots import flush_pending, on_commit_once, project_months, schedule_refresh
+
+# modèle -> (famille, champs de période, champs de montant)
+SOURCES = {
+    Project: ('projects', {'date_debut', 'date_fin'}, {'billing_status', 'budget_total'}),
+    Revenue: ('projects', {'project', 'project_id'}, {'avance'}),
+    Quote: ('quotes', {'date_livraison'}, {'total_ttc'}),
+    SupplierInvoice: ('suppliers', {'date'}, {'amount'}),
+    GeneralExpense: ('general', {'date'}, {'amount', 'category'}),
+    MonthlyLabourCost: ('labour', {'year', 'month'}, {'amount', 'description'}),
+}
+
+
+def instance_months(instance):
+    """Mois du snapshot concernés par une ligne source"""
+    if isinstance(instance, Project):
+        return project_months(instance.date_debut, instance.date_fin)
+    if isinstance(instance, Revenue):
+        project = Project.objects.filter(pk=instance.project_id).values('date_debut', 'date_fin').first()
+        return project_months(**project) if project else []
+    if isinstance(instance, MonthlyLabourCost):
+        return [(instance.year, instance.month)]
+    day = instance.date_livraison if isinstance(instance, Quote) else instance.date
+    return [(day.year, day.month)] if day else []
+
+
+def remember_previous_months(sender, instance, update_fields=None, **kwargs):
+    """Période avant modification, à rafraîchir aussi si la ligne change de mois"""
+    period_fields = SOURCES[sender][1]
+    if instance._state.adding or (update_fields is not None and not period_fields.intersection(update_fields)):
+        return
+    previous = sender.objects.filter(pk=instance.pk).first()
+    instance._snapshot_months = instance_months(previous) if previous else []
+
+
+def refresh_on_save(sender, instance, update_fields=None, **kwargs):
+    family, period_fields, amount_fields = SOURCES[sender]
+    previous = instance.__dict__.pop('_snapshot_months', [])
+    if update_fields is not None and not (period_fields | amount_fields).intersection(update_fields):
+        return
+    schedule_refresh(set(instance_months(instance)) | set(previous), family)
+
+
+def refresh_on_delete(sender, instance, **kwargs):
+    schedule_refresh(instance_months(instance), SOURCES[sender][0])
+
+
+def invalidate_kpis(sender, **kwargs):
+    on_commit_once(refresh_and_invalidate)
+
+
+def refresh_and_invalidate():
+    # Snapshots d'abord : la nouvelle version des KPI les voit à jour
+    flush_pending()
+    bump_kpis_version()
+
+
+for model in SOURCES:
+    pre_save.connect(remember_previous_months, sender=model, dispatch_uid=f'snapshot_pre_save_{model.__name__}')
+    post_save.connect(refresh_on_save, sender=model, dispatch_uid=f'snapshot_post_save_{model.__name__}')
+    post_delete.connect(refresh_on_delete, sender=model, dispatch_uid=f'snapshot_post_delete_{model.__name__}')
+
+for model in (*SOURCES, Invoice):
+    post_save.connect(invalidate_kpis, sender=model, dispatch_uid=f'kpi_cache_post_save_{model.__name__}')
+    post_delete.connect(invalidate_kpis, sender=model, dispatch_uid=f'kpi_cache_post_delete_{model.__name__}')
@@ -0,0 +1,323 @@
+"""
+Snapshots financiers mensuels (MonthlyFinancialSnapshot) : calcul, mise à jour et lecture.
+
+Les agrégats d'un mois sont regroupés par famille, chacune alimentée par ses modèles
+sources (voir dashboard/signals.py) :
+ - projects  : Project, Revenue (projets actifs sur le mois, avances)
+ - quotes    : Quote (par date de livraison)
+ - suppliers : SupplierInvoice
+ - labour    : MonthlyLabourCost
+ - general   : GeneralExpense
+
+Une écriture ne recalcule que les mois et la famille concernés, une seule fois par
+transaction. Le calcul d'une famille coûte un nombre fixe de requêtes groupées, quel
+que soit le nombre de mois.
+
+Les fonctions de calcul prennent un registre d'applications pour être utilisables
+depuis une migration (modèles historiques).
+"""
+import calendar
+import threading
+from datetime import date
+from decimal import Decimal
+
+from django.apps import apps as django_apps
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from projects.models import active_during
+
+FAMILIES = {
+    'projects': ('billed', 'unbilled', 'in_progress', 'advances'),
+    'quotes': ('quotes_count', 'quotes_amount'),
+    'suppliers': ('suppliers_total',),
+    'labour': ('labour_total', 'labour_entered', 'labour_description'),
+    'general': ('general_total', 'general_by_category'),
+}
+
+BILLING_FIELDS = {'FACTURE': 'billed', 'NON_FACTURE': 'unbilled', 'EN_COURS': 'in_progress'}
+
+# Mois par requête d'agrégation conditionnelle (projets)
+CHUNK_MONTHS = 24
+
+_pending = threading.local()
+
+
+def month_bounds(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def month_index(year, month):
+    return year * 12 + month - 1
+
+
+def months_between(first, last):
+    """(année, mois) de first à last inclus, chacun donné en (année, mois)"""
+    return [(i // 12, i % 12 + 1) for i in range(month_index(*first), month_index(*last) + 1)]
+
+
+def active_projects(start, end, prefix=''):
+    """
+    Projets dont la période [date_debut, date_fin] recoupe [start, end] (date_fin vide = en cours).
+    Forme simple pour les filtres d'agrégats ; pour sélectionner des lignes : active_during
+    """
+    return Q(**{f'{prefix}date_debut__lte': end}) & (
+        Q(**{f'{prefix}date_fin__gte': start}) | Q(**{f'{prefix}date_fin__isnull': True})
+    )
+
+
+def _empty_values(families):
+    values = {field: Decimal(0) for family in families for field in FAMILIES[family]}
+    for field, default in (('quotes_count', 0), ('labour_entered', False),
+                           ('labour_description', None), ('general_by_category', {})):
+        if field in values:
+            values[field] = default
+    return values
+
+
+def _monthly_rows(queryset, date_field, months, *group_by, **aggregates):
+    """Lignes agrégées par mois de date_field (et group_by) sur la période couverte par months"""
+    start, end = month_bounds(*months[0])[0], month_bounds(*months[-1])[1]
+    return queryset.filter(**{f'{date_field}__gte': start, f'{date_field}__lte': end}) \
+        .annotate(bucket=TruncMonth(date_field)).order_by() \
+        .values('bucket', *group_by).annotate(**aggregates)
+
+
+def _project_facts(registry, months, facts):
+    Project = registry.get_model('projects', 'Project')
+    Revenue = registry.get_model('projects', 'Revenue')
+    for i in range(0, len(months), CHUNK_MONTHS):
+        chunk = months[i:i + CHUNK_MONTHS]
+        # Sélection indexée des projets de la fenêtre, puis ventilation par mois
+        window = active_during(month_bounds(*chunk[0])[0], month_bounds(*chunk[-1])[1], registry)
+        budgets, advances = {}, {}
+        for year, month in chunk:
+            active = active_projects(*month_bounds(year, month))
+            for status, field in BILLING_FIELDS.items():
+                budgets[f'{field}_{year}_{month}'] = Sum('budget_total', filter=active & Q(billing_status=status))
+            advances[f'advances_{year}_{month}'] = Sum(
+                'avance', filter=active_projects(*month_bounds(year, month), prefix='project__')
+            )
+        totals = Project.objects.filter(window).aggregate(**budgets)
+        totals.update(Revenue.objects.filter(project__in=Project.objects.filter(window)).aggregate(**advances))
+        for year, month in chunk:
+            for field in (*BILLING_FIELDS.values(), 'advances'):
+                facts[(year, month)][field] = totals[f'{field}_{year}_{month}'] or Decimal(0)
+
+
+def _quote_facts(registry, months, facts):
+    Quote = registry.get_model('quotes', 'Quote')
+    for row in _monthly_rows(Quote.objects, 'date_livraison', months, amount=Sum('total_ttc'), count=Count('pk')):
+        values = facts.get((row['bucket'].year, row['bucket'].month))
+        if values is not None:
+            values['quotes_count'] = row['count']
+            values['quotes_amount'] = row['amount'] or Decimal(0)
+
+
+def _supplier_facts(registry, months, facts):
+    SupplierInvoice = registry.get_model('suppliers', 'SupplierInvoice')
+    for row in _monthly_rows(SupplierInvoice.objects, 'date', months, amount=Sum('amount')):
+        values = facts.get((row['bucket'].year, row['bucket'].month))
+        if values is not None:
+            values['suppliers_total'] = row['amount'] or Decimal(0)
+
+
+def _labour_facts(registry, months, facts):
+    MonthlyLabourCost = registry.get_model('budget', 'MonthlyLabourCost')
+    rows = MonthlyLabourCost.objects.filter(year__gte=months[0][0], year__lte=months[-1][0]) \
+        .order_by('year', 'month', 'pk').values('year', 'month', 'amount', 'description')
+    for row in rows:
+        values = facts.get((row['year'], row['month']))
+        if values is None:
+            continue
+        if not values['labour_entered']:
+            values['labour_description'] = row['description']
+        values['labour_entered'] = True
+        values['labour_total'] += row['amount']
+
+
+def _general_facts(registry, months, facts):
+    GeneralExpense = registry.get_model('budget', 'GeneralExpense')
+    for row in _monthly_rows(GeneralExpense.objects, 'date', months, 'category', amount=Sum('amount')):
+        values = facts.get((row['bucket'].year, row['bucket'].month))
+        if values is not None:
+            amount = row['amount'] or Decimal(0)
+            values['general_total'] += amount
+            values['general_by_category'][row['category']] = str(amount)
+
+
+FAMILY_FACTS = {
+    'projects': _project_facts,
+    'quotes': _quote_facts,
+    'suppliers': _supplier_facts,
+    'labour': _labour_facts,
+    'general': _general_facts,
+}
+
+
+def compute_facts(months, families=tuple(FAMILIES), registry=django_apps):
+    """{(année, mois): {champ: valeur}} des familles demandées, calculé depuis les tables sources"""
+    months = sorted(set(months))
+    facts = {key: _empty_values(families) for key in months}
+    if months:
+        for family in families:
+            FAMILY_FACTS[family](registry, months, facts)
+    return facts
+
+
+def refresh_snapshots(months, families=tuple(FAMILIES), registry=django_apps):
+    """
+    Recalcule les familles demandées des mois donnés. Les mois sans snapshot sont
+    créés complets (toutes familles).
+    """
+    Snapshot = registry.get_model('dashboard', 'MonthlyFinancialSnapshot')
+    months = sorted(set(months))
+    if not months:
+        return
+    existing = set(
+        Snapshot.objects.filter(year__gte=months[0][0], year__lte=months[-1][0]).values_list('year', 'month')
+    )
+    for keys, fams in (([m for m in months if m in existing], tuple(families)),
+                       ([m for m in months if m not in existing], tuple(FAMILIES))):
+        if not keys:
+            continue
+        facts = compute_facts(keys, fams, registry)
+        Snapshot.objects.bulk_create(
+            [Snapshot(year=year, month=month, **facts[(year, month)]) for year, month in keys],
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['year', 'month'],
+            update_fields=[field for family in fams for field in FAMILIES[family]] + ['updated_at'],
+        )
+
+
+def schedule_refresh(months, family):
+    """
+    Rafraîchit la famille des mois donnés au commit de la transaction en cours.
+    Les demandes d'une même transaction sont regroupées : un mois n'est recalculé
+    qu'une fois. Celles d'une transaction annulée sont rejouées au commit suivant,
+    sans conséquence (recalcul depuis les tables sources).
+    """
+    if not months:
+        return
+    pending = _pending.__dict__.setdefault('months', {})
+    for key in months:
+        pending.setdefault(key, set()).add(family)
+    on_commit_once(flush_pending)
+
+
+def on_commit_once(func):
+    """transaction.on_commit, sauf si func est déjà enregistrée dans la transaction en cours"""
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(callback is func for _, callback, _ in connection.run_on_commit):
+        return
+    transaction.on_commit(func)
+
+
+def flush_pending():
+    """Rafraîchit les mois en attente (au commit, voir schedule_refresh)"""
+    pending = getattr(_pending, 'months', None)
+    if not pending:
+        return
+    _pending.months = {}
+    by_families = {}
+    for key, families in pending.items():
+        by_families.setdefault(frozenset(families), []).append(key)
+    try:
+        for families, months in by_families.items():
+            refresh_snapshots(months, sorted(families))
+    except Exception as e:
+        # L'écriture source est déjà validée : rebuild_financial_snapshots rattrape l'écart
+        print(f"Error refreshing financial snapshots: {e}")
+
+
+def open_end_month():
+    """Dernier mois couvert par un projet sans date de fin : mois courant ou dernier snapshot"""
+    from .models import MonthlyFinancialSnapshot
+    today = timezone.now().date()
+    last = MonthlyFinancialSnapshot.objects.order_by('-year', '-month').values_list('year', 'month').first()
+    return max((today.year, today.month), last or (0, 0))
+
+
+def project_months(date_debut, date_fin):
+    """Mois d'activité d'un projet"""
+    if date_debut is None:
+        return []
+    last = (date_fin.year, date_fin.month) if date_fin else open_end_month()
+    return months_between((date_debut.year, date_debut.month), last)
+
+
+def get_snapshots(months):
+    """
+    {(année, mois): MonthlyFinancialSnapshot}. Les mois absents entre le premier snapshot et
+    le mois courant sont calculés et enregistrés ; les autres (période demandée hors des
+    données) sont calculés sans être enregistrés : une lecture ne crée pas de mois futurs.
+    """
+    from .models import MonthlyFinancialSnapshot
+    months = list(months)
+    if not months:
+        return {}
+    first, last = min(months), max(months)
+
+    def fetch():
+        rows = MonthlyFinancialSnapshot.objects.filter(year__gte=first[0], year__lte=last[0])
+        return {(row.year, row.month): row for row in rows}
+
+    snapshots = fetch()
+    missing = [key for key in months if key not in snapshots]
+    if missing:
+        today = timezone.now().date()
+        stored = MonthlyFinancialSnapshot.objects.order_by('year', 'month').values_list('year', 'month').first()
+        kept = [key for key in missing if stored and tuple(stored) <= key <= (today.year, today.month)]
+        if kept:
+            refresh_snapshots(kept)
+            snapshots = fetch()
+        transient = [key for key in missing if key not in kept]
+        for key, values in compute_facts(transient).items():
+            snapshots[key] = MonthlyFinancialSnapshot(year=key[0], month=key[1], **values)
+    return {key: snapshots[key] for key in months}
+
+
+def get_snapshot(year, month):
+    return get_snapshots([(year, month)])[(year, month)]
+
+
+def data_months(registry=django_apps, today=None):
+    """Mois couverts par les données sources (jusqu'au mois courant au moins), [] si aucune donnée"""
+    today = today or timezone.now().date()
+    bounds = []
+    for app_label, model_name, first_field, last_fields in (
+        ('projects', 'Project', 'date_debut', ('date_debut', 'date_fin')),
+        ('quotes', 'Quote', 'date_livraison', ('date_livraison',)),
+        ('suppliers', 'SupplierInvoice', 'date', ('date',)),
+        ('budget', 'GeneralExpense', 'date', ('date',)),
+    ):
+        model = registry.get_model(app_label, model_name)
+        aggregates = {'first': Min(first_field)}
+        aggregates.update({f'last_{field}': Max(field) for field in last_fields})
+        for value in model.objects.aggregate(**aggregates).values():
+            if value is not None:
+                bounds.append((value.year, value.month))
+    labour = registry.get_model('budget', 'MonthlyLabourCost').objects
+    for row in (labour.order_by('year', 'month').values_list('year', 'month').first(),
+                labour.order_by('-year', '-month').values_list('year', 'month').first()):
+        if row is not None:
+            bounds.append(tuple(row))
+    if not bounds:
+        return []
+    return months_between(min(bounds), max(bounds + [(today.year, today.month)]))
+
+
+def rebuild_snapshots(registry=django_apps, today=None):
+    """Recalcule tous les snapshots depuis les tables sources ; retourne (mois recalculés, supprimés)"""
+    Snapshot = registry.get_model('dashboard', 'MonthlyFinancialSnapshot')
+    started = timezone.now()
+    months = data_months(registry, today)
+    with transaction.atomic():
+        for i in range(0, len(months), 120):
+            refresh_snapshots(months[i:i + 120], registry=registry)
+        # Mois hors de la période des données
+        removed, _ = Snapshot.objects.filter(updated_at__lt=started).delete()
+    return len(months), removed
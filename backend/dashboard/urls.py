@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import DashboardKPIView
+from .views import DashboardKPIView, DashboardKPICacheView
 
 urlpatterns = [
     path('kpis/', DashboardKPIView.as_view(), name='dashboard-kpis'),
+    path('kpis/cache/', DashboardKPICacheView.as_view(), name='dashboard-kpis-cache'),
 ]
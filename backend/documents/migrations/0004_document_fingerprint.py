@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_document_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='fingerprint',
+            field=models.CharField(blank=True, help_text="Empreinte du contenu source d'un PDF généré", max_length=64, null=True),
+        ),
+    ]
@@ -14,6 +14,7 @@ class Document(models.Model):
     file_url = models.FileField(upload_to='documents/') # This will use the configured storage
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='documents', db_column='id_project')
     created_at = models.DateTimeField(auto_now_add=True)
+    fingerprint = models.CharField(max_length=64, blank=True, null=True, help_text="Empreinte du contenu source d'un PDF généré")
 
     class Meta:
         db_table = 'DOCUMENTS'
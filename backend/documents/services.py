@@ -0,0 +1,150 @@
+import atexit
+import mimetypes
+import os
+import threading
+from urllib.parse import quote
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, transaction
+from django.http import HttpResponse, HttpResponseRedirect, FileResponse
+from django.utils.http import content_disposition_header
+from .models import Document
+
+
+def replace_project_document(project, document_name, file_name, content, type_document='PDF', fingerprint=None):
+    """Enregistre un fichier dans les documents du projet en remplaçant la version précédente"""
+    # Delete existing document with same name to keep only latest version
+    existing_docs = Document.objects.filter(
+        name=document_name,
+        project=project
+    )
+    for doc in existing_docs:
+        if doc.file_url:
+            doc.file_url.delete(save=False)
+        doc.delete()
+
+    document = Document(
+        name=document_name,
+        type_document=type_document,
+        project=project,
+        fingerprint=fingerprint
+    )
+    document.file_url.save(file_name, ContentFile(content), save=False)
+    document.save()
+    return document
+
+
+def find_fingerprinted_document(project, document_name, fingerprint):
+    """Document déjà généré pour cette empreinte et dont le fichier existe encore, sinon None"""
+    document = Document.objects.filter(
+        name=document_name,
+        project=project,
+        fingerprint=fingerprint
+    ).order_by('-created_at').first()
+    if document and document.file_url and document.file_url.storage.exists(document.file_url.name):
+        return document
+    return None
+
+
+class DocumentWriter:
+    """
+    Écriture différée (write-behind) des documents générés.
+
+    Les PDF sont mis en file et remplacés dans le stockage par un thread du processus,
+    après la réponse au client. Les rendus successifs d'un même document (projet, nom)
+    encore en attente sont fusionnés : seul le dernier est écrit. Une écriture dont
+    l'empreinte est déjà stockée est ignorée (idempotence).
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._writing = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, project, document_name, file_name, content, type_document='PDF', fingerprint=None):
+        with self._condition:
+            # Remplace un rendu plus ancien du même document encore en attente
+            self._pending[(project.pk, document_name)] = (
+                project, document_name, file_name, content, type_document, fingerprint
+            )
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='document-writer', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Attend que toutes les écritures en attente soient terminées"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._writing = False
+                    self._condition.notify_all()
+                    # Inactif : libérer la connexion DB de ce thread
+                    connections.close_all()
+                    self._condition.wait_for(lambda: self._pending)
+                key = next(iter(self._pending))
+                job = self._pending.pop(key)
+                self._writing = True
+            self._write(*job)
+
+    def _write(self, project, document_name, file_name, content, type_document, fingerprint):
+        try:
+            if fingerprint and find_fingerprinted_document(project, document_name, fingerprint):
+                return
+            replace_project_document(project, document_name, file_name, content, type_document, fingerprint)
+        except Exception as e:
+            print(f"Error persisting document {document_name}: {e}")
+
+
+document_writer = DocumentWriter()
+# Ne pas perdre les documents en attente à l'arrêt du worker
+atexit.register(document_writer.flush, 10)
+
+
+def persist_project_document(project, document_name, file_name, content, type_document='PDF', fingerprint=None):
+    """
+    Enregistre le document en arrière-plan (PDF_WRITE_BEHIND) ou immédiatement.
+    En arrière-plan, la mise en file attend la validation de la transaction en cours : le
+    thread d'écriture a sa propre connexion et ne voit que les lignes validées.
+    """
+    if getattr(settings, 'PDF_WRITE_BEHIND', True):
+        transaction.on_commit(lambda: document_writer.submit(
+            project, document_name, file_name, content, type_document, fingerprint
+        ))
+    else:
+        replace_project_document(project, document_name, file_name, content, type_document, fingerprint)
+
+
+def serve_document(document, filename=None, as_attachment=True):
+    """
+    Réponse de téléchargement d'un document sans faire transiter ses octets par le worker.
+
+    - stockage local : en-tête X-Accel-Redirect, nginx envoie le fichier
+    - stockage distant (S3) : redirection vers une URL présignée de courte durée
+    Les requêtes Range sont gérées par nginx ou S3.
+    """
+    field = document.file_url
+    storage = field.storage
+    filename = filename or os.path.basename(field.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, filename)
+
+    if isinstance(storage, FileSystemStorage):
+        if not settings.DOCUMENT_ACCEL_REDIRECT:
+            return FileResponse(field.open('rb'), as_attachment=as_attachment, filename=filename, content_type=content_type)
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(settings.DOCUMENT_ACCEL_REDIRECT_PREFIX + field.name)
+        response['Content-Disposition'] = disposition
+        return response
+
+    url = storage.url(field.name, parameters={
+        'ResponseContentDisposition': disposition,
+        'ResponseContentType': content_type,
+    }, expire=settings.DOCUMENT_URL_EXPIRY)
+    return HttpResponseRedirect(url)
@@ -1,8 +1,18 @@
+from rest_framework.decorators import action
 from core.views import BaseViewSet
 from .models import Document
 from .serializers import DocumentSerializer
+from .services import serve_document
 
 class DocumentViewSet(BaseViewSet):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
     module_name = 'documents'
+    rbac_actions = {'download': 'can_read'}
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Téléchargement du fichier, délégué à nginx (X-Accel-Redirect) ou à S3 (URL présignée)"""
+        document = self.get_object()
+        as_attachment = request.query_params.get('inline') not in ('1', 'true')
+        return serve_document(document, as_attachment=as_attachment)
@@ -188,6 +188,34 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Expose l'état STARTED des jobs (suivi de la génération PDF asynchrone)
+CELERY_TASK_TRACK_STARTED = True
+# Publication depuis les requêtes : broker indisponible = échec immédiat (au lieu de
+# plusieurs secondes de nouvelles tentatives), l'appelant prend le relais
+CELERY_BROKER_TRANSPORT_OPTIONS = {'max_retries': 1, 'interval_start': 0, 'interval_step': 0.2, 'interval_max': 0.5}
+# Conservation des résultats (secondes) ; les jobs PDF asynchrones restent connus aussi longtemps
+CELERY_RESULT_EXPIRES = int(os.environ.get('CELERY_RESULT_EXPIRES', 86400))
+
+# Cache applicatif (KPI du tableau de bord) : Redis, base 1 (la base 0 sert à Celery),
+# défini par docker-compose. Par défaut (REDIS_CACHE_URL vide) : cache mémoire local
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL', '')
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+            'KEY_PREFIX': 'multisarl',
+        }
+    }
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# Durée de vie des KPI en cache (secondes) : borne la péremption si une invalidation est manquée
+KPI_CACHE_TIMEOUT = int(os.environ.get('KPI_CACHE_TIMEOUT', 300))
+
+# Export PDF groupé : nombre de processus de rendu (0 = rendu séquentiel)
+PDF_EXPORT_WORKERS = int(os.environ.get('PDF_EXPORT_WORKERS', min(4, os.cpu_count() or 1)))
+# Les PDF générés sont enregistrés dans Documents en arrière-plan, après la réponse
+PDF_WRITE_BEHIND = os.environ.get('PDF_WRITE_BEHIND', 'True') == 'True'
 
 # Storage (Abstraction)
 if os.environ.get('USE_S3') == 'true':
@@ -198,6 +226,19 @@ if os.environ.get('USE_S3') == 'true':
 else:
     DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 
+# DEFAULT_FILE_STORAGE n'est plus lu depuis Django 5.1
+STORAGES = {
+    'default': {'BACKEND': DEFAULT_FILE_STORAGE},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Téléchargement des documents : nginx sert les fichiers locaux (X-Accel-Redirect),
+# S3 via une URL présignée de courte durée. DOCUMENT_ACCEL_REDIRECT=True uniquement derrière
+# le nginx de production (docker-compose.prod.yml) : sinon Django envoie le fichier lui-même.
+DOCUMENT_ACCEL_REDIRECT = os.environ.get('DOCUMENT_ACCEL_REDIRECT', 'False') == 'True'
+DOCUMENT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+DOCUMENT_URL_EXPIRY = int(os.environ.get('DOCUMENT_URL_EXPIRY', 300))
+
 # CSRF Config moved up to use env var
 # CSRF_TRUSTED_ORIGINS = ['http://35.208.189.105', 'http://localhost']
 
@@ -0,0 +1,160 @@
+"""
+Benchmark des recherches de projets actifs sur une période (projects.models.active_during).
+
+    python manage.py benchmark_active_projects --projects 100000 --repeat 5 --output bench_projects.json
+
+Compare, sur des projets synthétiques :
+ - indexed : active_during (index de dates et pont ProjectActivity)
+ - scan    : la condition d'origine, index de dates supprimés
+
+Les données et la suppression des index sont faites dans une transaction annulée en
+fin de benchmark (la table PROJECTS est verrouillée pendant la mesure : à lancer hors
+production).
+"""
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from clients.models import Client
+from projects.models import Project, ProjectActivity, active_during
+
+PERIOD_INDEXES = ('projects_start_idx', 'projects_open_start_idx')
+# Historique synthétique : projets démarrés sur 20 ans
+FIRST_YEAR, YEARS = 2006, 20
+
+
+def legacy_condition(start, end):
+    return Q(date_debut__lte=end) & (Q(date_fin__gte=start) | Q(date_fin__isnull=True))
+
+
+def month_period(year, month):
+    following = datetime.date(year + month // 12, month % 12 + 1, 1)
+    return datetime.date(year, month, 1), following - datetime.timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = "Benchmark des recherches de projets actifs sur une période (index de période vs parcours)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=100000, help="Nombre de projets synthétiques")
+        parser.add_argument('--repeat', type=int, default=5, help="Nombre d'exécutions par cas")
+        parser.add_argument('--output', help="Fichier JSON des résultats")
+
+    def handle(self, *args, **options):
+        self.repeat = max(1, options['repeat'])
+        cases = self._cases()
+
+        results = []
+        with transaction.atomic():
+            self._make_projects(options['projects'])
+            for name, start, end in cases:
+                results.append(self._run_case('indexed', name, start, end, active_during(start, end)))
+            self._drop_period_indexes()
+            for name, start, end in cases:
+                results.append(self._run_case('scan', name, start, end, legacy_condition(start, end)))
+            transaction.set_rollback(True)
+
+        self._print_summary(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'environment': self._environment(options['projects']), 'results': results}, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
+
+    def _cases(self):
+        last_year = FIRST_YEAR + YEARS - 1
+        cases = [(f'month {year}-{month:02d}', *month_period(year, month))
+                 for year, month in ((FIRST_YEAR + 1, 3), (FIRST_YEAR + YEARS // 2, 6), (last_year, 12))]
+        cases.append(('window 6 months', month_period(last_year, 7)[0], month_period(last_year, 12)[1]))
+        cases.append(('window 5 years', datetime.date(last_year - 4, 1, 1), datetime.date(last_year, 12, 31)))
+        return cases
+
+    # --- Données synthétiques ---
+
+    def _make_projects(self, count):
+        client, _ = Client.objects.get_or_create(
+            nom_client='Client Benchmark', defaults={'adresse': 'Zone industrielle', 'ice': '001234567000089'}
+        )
+        rng = random.Random(42)
+        first_day = datetime.date(FIRST_YEAR, 1, 1)
+        projects = []
+        for i in range(count):
+            date_debut = first_day + datetime.timedelta(days=rng.randrange(YEARS * 365))
+            # 5 % de projets sans date de fin, les autres durent de 2 semaines à 18 mois
+            date_fin = None if rng.random() < 0.05 else date_debut + datetime.timedelta(days=rng.randrange(14, 540))
+            projects.append(Project(
+                nom_projet=f'Benchmark {i}', date_debut=date_debut, date_fin=date_fin,
+                budget_total=Decimal(rng.randrange(10000, 5000000)) / 100, client=client,
+                billing_status=rng.choice(('FACTURE', 'NON_FACTURE', 'EN_COURS')),
+            ))
+        projects = Project.objects.bulk_create(projects, batch_size=5000)
+        ProjectActivity.objects.bulk_create(ProjectActivity.rows(projects), batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE "PROJECTS"')
+            cursor.execute('ANALYZE "PROJECT_ACTIVITY"')
+
+    def _drop_period_indexes(self):
+        with connection.cursor() as cursor:
+            for name in PERIOD_INDEXES:
+                cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+    # --- Mesures ---
+
+    def _run_case(self, strategy, name, start, end, condition):
+        queryset = Project.objects.filter(condition)
+        times = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            totals = queryset.aggregate(count=Count('pk'), budget=Sum('budget_total'))
+            times.append(round((time.perf_counter() - started) * 1000, 2))
+
+        result = {
+            'strategy': strategy,
+            'case': name,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'projects': totals['count'],
+            'budget': str(Decimal(totals['budget'] or 0).quantize(Decimal('0.01'))),
+            'wall_ms': {'min': min(times), 'median': statistics.median(times), 'max': max(times), 'all': times},
+            'plan': queryset.explain(),
+        }
+        self.stdout.write(
+            f"{strategy:<8} {name:<16} median={result['wall_ms']['median']:>9.2f}ms projects={totals['count']}"
+        )
+        return result
+
+    def _print_summary(self, results):
+        indexed = {r['case']: r for r in results if r['strategy'] == 'indexed'}
+        mismatches = 0
+        for r in results:
+            if r['strategy'] != 'scan':
+                continue
+            reference = indexed[r['case']]
+            if (r['projects'], r['budget']) != (reference['projects'], reference['budget']):
+                mismatches += 1
+                self.stderr.write(f"{r['case']} : résultats différents entre indexed et scan")
+            speedup = r['wall_ms']['median'] / max(reference['wall_ms']['median'], 0.01)
+            self.stdout.write(f"{r['case']:<16} x{speedup:.1f}")
+        self.stdout.write(self.style.SUCCESS(f"{len(indexed)} cas mesurés, {mismatches} écart(s) de résultat"))
+
+    def _environment(self, projects):
+        return {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'projects': projects,
+            'repeat': self.repeat,
+        }
@@ -0,0 +1,34 @@
+"""
+Reconstruit le pont projet / mois d'activité (ProjectActivity) à partir des dates des projets.
+
+    python manage.py rebuild_project_activity
+
+Le pont est ensuite tenu à jour par Project.save ; la reconstruction sert après des
+imports ou modifications de dates en masse (bulk_create, update(), SQL direct).
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from projects.models import Project, ProjectActivity
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les mois d'activité des projets (recherche des projets actifs sur une période)"
+
+    def handle(self, *args, **options):
+        count = 0
+        with transaction.atomic():
+            ProjectActivity.objects.all().delete()
+            batch = []
+            for project in Project.objects.filter(date_fin__isnull=False) \
+                    .only('pk', 'date_debut', 'date_fin').iterator(chunk_size=BATCH_SIZE):
+                batch.extend(ProjectActivity.rows([project]))
+                if len(batch) >= BATCH_SIZE:
+                    ProjectActivity.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            ProjectActivity.objects.bulk_create(batch)
+            count += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"{count} mois d'activité enregistré(s)"))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:42
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_activity(apps, schema_editor):
+    # Mois d'activité des projets existants (voir ProjectActivity.months)
+    Project = apps.get_model('projects', 'Project')
+    ProjectActivity = apps.get_model('projects', 'ProjectActivity')
+    batch = []
+    for project_id, date_debut, date_fin in Project.objects.filter(date_fin__isnull=False) \
+            .values_list('pk', 'date_debut', 'date_fin').iterator(chunk_size=2000):
+        first = date_debut.year * 12 + date_debut.month - 1
+        last = date_fin.year * 12 + date_fin.month - 1
+        batch.extend(
+            ProjectActivity(project_id=project_id, month=datetime.date(i // 12, i % 12 + 1, 1))
+            for i in range(first, last + 1)
+        )
+        if len(batch) >= 5000:
+            ProjectActivity.objects.bulk_create(batch)
+            batch = []
+    ProjectActivity.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0004_client_ice'),
+        ('projects', '0010_make_date_fin_optional'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+            ],
+            options={
+                'db_table': 'PROJECT_ACTIVITY',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['date_debut'], name='projects_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(condition=models.Q(('date_fin__isnull', True)), fields=['date_debut'], name='projects_open_start_idx'),
+        ),
+        migrations.AddField(
+            model_name='projectactivity',
+            name='project',
+            field=models.ForeignKey(db_column='id_project', on_delete=django.db.models.deletion.CASCADE, related_name='activity_months', to='projects.project'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='projectactivity',
+            unique_together={('month', 'project')},
+        ),
+        migrations.RunPython(populate_activity, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,40 @@
+from datetime import date
+from django.apps import apps
 from django.db import models
+from django.db.models import Q
 from clients.models import Client
 from budget.models import Employee
 
+# Au-delà, une période couvre une part importante des projets : un parcours de la table
+# coûte moins que les accès par index
+INDEXED_PERIOD_DAYS = 366
+
+
+def active_during(start, end, registry=None):
+    """
+    Projets actifs sur [start, end] (date_fin vide = en cours). Jusqu'à un an, trois
+    branches servies par index, de coût proportionnel au résultat et non à la table :
+     - démarrés dans la période (projects_start_idx)
+     - en cours au début de la période, terminés ensuite : pont ProjectActivity du mois de start
+     - sans date de fin, démarrés avant la fin de la période (projects_open_start_idx)
+    """
+    condition = Q(date_debut__lte=end) & (Q(date_fin__gte=start) | Q(date_fin__isnull=True))
+    if (end - start).days > INDEXED_PERIOD_DAYS:
+        # Négation : SQLite (sans statistiques de distribution) ne passe pas par projects_start_idx
+        return ~Q(date_debut__gt=end) & (Q(date_fin__gte=start) | Q(date_fin__isnull=True))
+    try:
+        activity = (registry or apps).get_model('projects', 'ProjectActivity')
+    except LookupError:
+        # Migrations antérieures au pont
+        return condition
+    running = activity.objects.filter(month=start.replace(day=1)).values('project_id')
+    return (
+        Q(date_debut__gte=start, date_debut__lte=end) & (Q(date_fin__gte=start) | Q(date_fin__isnull=True))
+        | Q(pk__in=running, date_debut__lt=start, date_fin__gte=start)
+        | Q(date_fin__isnull=True, date_debut__lte=end)
+    )
+
+
 class Project(models.Model):
     STATUS_CHOICES = [
         ('EN_COURS', 'En cours'),
@@ -30,10 +63,58 @@ class Project(models.Model):
 
     class Meta:
         db_table = 'PROJECTS'
+        # Recherche des projets actifs sur une période (voir active_during)
+        indexes = [
+            models.Index(fields=['date_debut'], name='projects_start_idx'),
+            models.Index(fields=['date_debut'], name='projects_open_start_idx', condition=Q(date_fin__isnull=True)),
+        ]
 
     def __str__(self):
         return self.nom_projet
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'date_debut', 'date_fin'} & set(update_fields):
+            ProjectActivity.sync([self])
+
+
+class ProjectActivity(models.Model):
+    """
+    Pont projet / mois d'activité des projets terminés (date_fin renseignée) : les projets
+    en cours à une date se lisent par index (voir active_during).
+    Tenu à jour par Project.save, reconstruit par rebuild_project_activity.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='activity_months', db_column='id_project')
+    month = models.DateField()  # 1er jour du mois
+
+    class Meta:
+        db_table = 'PROJECT_ACTIVITY'
+        unique_together = [['month', 'project']]
+
+    @staticmethod
+    def months(date_debut, date_fin):
+        """1ers jours des mois de [date_debut, date_fin] (aucun si le projet n'a pas de fin)"""
+        if date_debut is None or date_fin is None:
+            return []
+        first = date_debut.year * 12 + date_debut.month - 1
+        last = date_fin.year * 12 + date_fin.month - 1
+        return [date(i // 12, i % 12 + 1, 1) for i in range(first, last + 1)]
+
+    @classmethod
+    def rows(cls, projects):
+        return [
+            cls(project_id=project.pk, month=month)
+            for project in projects
+            for month in cls.months(project.date_debut, project.date_fin)
+        ]
+
+    @classmethod
+    def sync(cls, projects, batch_size=1000):
+        """Remplace les mois d'activité des projets donnés"""
+        cls.objects.filter(project__in=[project.pk for project in projects]).delete()
+        cls.objects.bulk_create(cls.rows(projects), batch_size=batch_size)
+
 class ProjectHR(models.Model):
     # id is default PK
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='hr_resources', db_column='id_project')
@@ -3,7 +3,7 @@ from .models import Project, ProjectHR, ProjectCost, Revenue, Expense
 from .serializers import ProjectSerializer, ProjectHRSerializer, ProjectCostSerializer, RevenueSerializer, ExpenseSerializer
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Sum, Q
+from dashboard.snapshots import get_snapshot
 import datetime
 
 class ProjectViewSet(BaseViewSet):
@@ -22,73 +22,34 @@ class ProjectViewSet(BaseViewSet):
             year = today.year
             month = today.month
             
-        # Determine period dates
-        import calendar
-        _, last_day = calendar.monthrange(year, month)
-        start_date = datetime.date(year, month, 1)
-        end_date = datetime.date(year, month, last_day)
+        # Agrégats du mois : snapshot financier (dashboard/snapshots.py)
+        snapshot = get_snapshot(year, month)
+
+        # 1. Revenue (Projects active in period), par statut de facturation
+        billed = snapshot.billed
+        unbilled = snapshot.unbilled
+        in_progress = snapshot.in_progress
+
+        # Project Advances (Avances de projet) des projets actifs sur la période
+        project_advances = snapshot.advances
 
-        # 1. Revenue (Projects active in period)
-        # Assuming we want to see ALL projects revenue if they overlap with the period
-        projects_in_period = self.queryset.filter(
-            date_debut__lte=end_date
-        ).filter(
-            Q(date_fin__gte=start_date) | Q(date_fin__isnull=True)
-        )
-        
-        revenue_stats = projects_in_period.values('billing_status').annotate(total=Sum('budget_total'))
-        
-        billed = 0
-        unbilled = 0
-        in_progress = 0
-        
-        for item in revenue_stats:
-            if item['billing_status'] == 'FACTURE':
-                billed = item['total'] or 0
-            elif item['billing_status'] == 'NON_FACTURE':
-                unbilled = item['total'] or 0
-            elif item['billing_status'] == 'EN_COURS':
-                in_progress = item['total'] or 0
-        
-        # Project Advances (Avances de projet) - Sum all advances from Revenue model
-        project_advances = Revenue.objects.filter(
-            project__in=projects_in_period
-        ).aggregate(total=Sum('avance'))['total'] or 0
-        
         # Gross Margin = Projects in Progress + Unbilled Projects + Billed Projects (without advances)
         gross_margin = billed + unbilled + in_progress
-        
+
         # Gross Margin with Advance = Gross Margin - Project Advances
         gross_margin_with_advance = gross_margin - project_advances
-        
-        # 2. Total Expenses (Dépenses Totales) = Labour + Supplies + Operating expenses
-        from suppliers.models import SupplierInvoice
-        from budget.models import GeneralExpense, MonthlyLabourCost
-        
-        # Supplies (Fournitures) - Supplier invoices
-        suppliers_total = SupplierInvoice.objects.filter(
-            date__year=year, 
-            date__month=month
-        ).aggregate(total=Sum('amount'))['total'] or 0
 
-        # Labor costs (Main d'œuvre) - From manual monthly labor cost entries
-        labor_total = MonthlyLabourCost.objects.filter(
-            year=year,
-            month=month
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        # 2. Total Expenses (Dépenses Totales) = Labour + Supplies + Operating expenses
+        suppliers_total = snapshot.suppliers_total  # Supplies (Fournitures) - Supplier invoices
+        labor_total = snapshot.labour_total  # Labor costs (Main d'œuvre) - manual monthly entries
+        general_total = snapshot.general_total  # Operating expenses (Charges) - General expenses
 
-        # Operating expenses (Charges) - General expenses
-        general_total = GeneralExpense.objects.filter(
-            date__year=year,
-            date__month=month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
         # Total Expenses = Labour + Supplies + Operating expenses
         total_expenses = suppliers_total + labor_total + general_total
-        
+
         # Net Margin = Gross Margin with Advance - Total Expenses
         net_margin = gross_margin_with_advance - total_expenses
-        
+
         return Response({
             'period': {'month': month, 'year': year},
             'revenue': {
@@ -0,0 +1,268 @@
+"""
+Tenue à jour du catalogue des désignations (CatalogItem) à partir des lignes de devis.
+
+Les écritures de lignes signalent les lignes ajoutées / retirées en (id, désignation,
+prix_unitaire) : schedule_update depuis QuoteLine.save, add_lines, sync_lines et la
+duplication, le signal post_delete pour les suppressions (cascades comprises, voir
+quotes/signals.py). Elles sont regroupées par transaction et appliquées une fois au
+commit : nombre d'utilisations, dernier prix, min et max sont ajustés sans relire
+l'historique des désignations, la médiane est recalculée par une seule tâche Celery.
+"""
+import statistics
+from decimal import Decimal
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .models import CatalogItem, QuoteLine, catalog_key
+
+# Au-delà, le recalcul complet est confié à Celery
+INLINE_REFRESH = 200
+# Identifiants par requête de vérification des lignes validées
+CHECK_BATCH = 1000
+
+UPSERT_FIELDS = [
+    'key', 'usage_count', 'last_price', 'last_line_id', 'median_price', 'min_price', 'max_price', 'updated_at',
+]
+# Champs ajustés à chaque écriture de lignes (apply_lines)
+INCREMENTAL_FIELDS = ['usage_count', 'last_price', 'last_line_id', 'min_price', 'max_price', 'updated_at']
+
+
+def price_median(prices):
+    return Decimal(statistics.median(prices)).quantize(Decimal('0.01'))
+
+
+def items_from_rows(rows):
+    """Entrées du catalogue à partir de (designation, prix_unitaire, id) triés par désignation puis id"""
+    for designation, group in groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        prices = [price for _, price, _ in group]
+        yield CatalogItem(
+            designation=designation,
+            key=catalog_key(designation),
+            usage_count=len(prices),
+            last_price=prices[-1],
+            last_line_id=group[-1][2],
+            median_price=price_median(prices),
+            min_price=min(prices),
+            max_price=max(prices),
+        )
+
+
+def upsert(items, batch_size=500):
+    CatalogItem.objects.bulk_create(
+        items, batch_size=batch_size,
+        update_conflicts=True, unique_fields=['designation'], update_fields=UPSERT_FIELDS,
+    )
+
+
+def refresh(designations, batch_size=500):
+    """Recalcule les entrées des désignations données (supprimées si plus aucune ligne ne les utilise)"""
+    designations = sorted({designation for designation in designations if designation})
+    for start in range(0, len(designations), batch_size):
+        chunk = designations[start:start + batch_size]
+        rows = QuoteLine.objects.filter(designation__in=chunk).order_by('designation', 'id') \
+            .values_list('designation', 'prix_unitaire', 'id')
+        items = list(items_from_rows(rows))
+        upsert(items, batch_size)
+        unused = set(chunk) - {item.designation for item in items}
+        if unused:
+            CatalogItem.objects.filter(designation__in=unused).delete()
+
+
+def refresh_medians(designations, batch_size=500):
+    """Recalcule uniquement la médiane des désignations données (tâche refresh_catalog_medians)"""
+    designations = sorted({designation for designation in designations if designation})
+    for start in range(0, len(designations), batch_size):
+        chunk = designations[start:start + batch_size]
+        rows = QuoteLine.objects.filter(designation__in=chunk).order_by('designation') \
+            .values_list('designation', 'prix_unitaire')
+        medians = {
+            designation: price_median([price for _, price in group])
+            for designation, group in groupby(rows, key=lambda row: row[0])
+        }
+        items = list(CatalogItem.objects.filter(designation__in=medians))
+        for item in items:
+            item.median_price = medians[item.designation]
+        CatalogItem.objects.bulk_update(items, ['median_price'], batch_size=batch_size)
+
+
+def apply_lines(item, added, removed):
+    """
+    Ajuste l'entrée pour des lignes ajoutées / retirées, données en (id, prix).
+    False si ses agrégats doivent être relus : retrait d'un extrême, de la ligne du
+    dernier prix, ou plus aucune utilisation.
+    """
+    if any(pk is None for pk, _ in added):
+        return False
+    for pk, price in removed:
+        if item.last_line_id in (None, pk) or price <= item.min_price or price >= item.max_price:
+            return False
+    if item.usage_count + len(added) - len(removed) <= 0:
+        return False
+    item.usage_count += len(added) - len(removed)
+    if added:
+        prices = [price for _, price in added]
+        item.min_price = min(item.min_price, *prices)
+        item.max_price = max(item.max_price, *prices)
+        pk, price = max(added)
+        # Identifiants croissants : une ligne ajoutée sans dernier id connu est la plus récente
+        if item.last_line_id is None or pk > item.last_line_id:
+            item.last_line_id, item.last_price = pk, price
+    return True
+
+
+def apply_changes(added=(), removed=()):
+    """
+    Met à jour le catalogue pour des lignes ajoutées / retirées, données en
+    (id, désignation, prix_unitaire) : une requête de lecture et une d'écriture, sans
+    relire l'historique des désignations. Seules les entrées nouvelles ou dont un
+    extrême a été retiré relisent leurs agrégats SQL (Count, Min, Max).
+    """
+    changes = {}
+    for removal, lines in ((False, added), (True, removed)):
+        for pk, designation, price in lines:
+            if designation:
+                changes.setdefault(designation, ([], []))[removal].append((pk, price))
+    if not changes:
+        return
+    with transaction.atomic():
+        items = {
+            item.designation: item
+            for item in CatalogItem.objects.select_for_update().filter(designation__in=changes).order_by('designation')
+        }
+        updated, stale = [], []
+        for designation, (plus, minus) in changes.items():
+            item = items.get(designation)
+            if item is not None and apply_lines(item, plus, minus):
+                item.updated_at = timezone.now()
+                updated.append(item)
+            else:
+                stale.append(designation)
+        CatalogItem.objects.bulk_update(updated, INCREMENTAL_FIELDS)
+        if stale:
+            _recount(stale, items)
+
+
+def _recount(designations, items):
+    """Relit les agrégats SQL des désignations ; la médiane est conservée (provisoire pour une nouvelle entrée)"""
+    rows = list(
+        QuoteLine.objects.filter(designation__in=designations).order_by().values('designation')
+        .annotate(count=Count('pk'), low=Min('prix_unitaire'), high=Max('prix_unitaire'), last_id=Max('pk'))
+    )
+    last_prices = dict(
+        QuoteLine.objects.filter(pk__in=[row['last_id'] for row in rows]).values_list('pk', 'prix_unitaire')
+    )
+    recounted = []
+    for row in rows:
+        last_price = last_prices[row['last_id']]
+        current = items.get(row['designation'])
+        recounted.append(CatalogItem(
+            designation=row['designation'],
+            key=catalog_key(row['designation']),
+            usage_count=row['count'],
+            last_price=last_price,
+            last_line_id=row['last_id'],
+            median_price=current.median_price if current else last_price,
+            min_price=row['low'],
+            max_price=row['high'],
+        ))
+    upsert(recounted)
+    unused = set(designations) - {item.designation for item in recounted}
+    if unused:
+        CatalogItem.objects.filter(designation__in=unused).delete()
+
+
+def committed_lines(events):
+    """
+    Changements réellement validés pour les événements (retrait, ligne) d'une transaction,
+    dans leur ordre : chaque ligne passe de son état d'avant la transaction (celui de son
+    premier retrait, absente si elle commence par un ajout) à son état en base. Les
+    événements d'un point de sauvegarde annulé ou qui se compensent ne comptent donc pas.
+    """
+    initial, unchecked = {}, []
+    for removal, line in events:
+        if line[0] is None:
+            # Ligne sans identifiant (bulk_create sans retour d'id) : prise telle quelle
+            unchecked.append(line)
+        elif line[0] not in initial:
+            initial[line[0]] = line if removal else None
+
+    ids = sorted(initial)
+    current = {}
+    for start in range(0, len(ids), CHECK_BATCH):
+        rows = QuoteLine.objects.filter(pk__in=ids[start:start + CHECK_BATCH]) \
+            .values_list('id', 'designation', 'prix_unitaire')
+        current.update((row[0], row) for row in rows)
+
+    added, removed = list(unchecked), []
+    for pk, before in initial.items():
+        after = current.get(pk)
+        if before != after:
+            if before is not None:
+                removed.append(before)
+            if after is not None:
+                added.append(after)
+    return added, removed
+
+
+class PendingLines:
+    """Lignes signalées dans une transaction, appliquées au catalogue à son commit"""
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self):
+        designations = {line[1] for _, line in self.events if line[1]}
+        try:
+            if len(designations) > INLINE_REFRESH:
+                _publish('refresh_quote_catalog', designations, fallback=refresh)
+                return
+            added, removed = committed_lines(self.events)
+            apply_changes(added, removed)
+            _publish('refresh_catalog_medians', {designation for _, designation, _ in added + removed})
+        except Exception as e:
+            # Écart rattrapé par rebuild_quote_catalog
+            print(f"Error updating quote catalog: {e}")
+
+
+def schedule_update(added=(), removed=()):
+    """
+    Signale des lignes ajoutées / retirées, données en (id, désignation, prix_unitaire).
+    Toutes celles d'une même transaction sont appliquées ensemble à son commit : une
+    mise à jour incrémentale et une publication Celery par transaction. Une transaction
+    annulée n'applique rien.
+    """
+    added, removed = list(added), list(removed)
+    if not added and not removed:
+        return
+    connection = transaction.get_connection()
+    pending = None
+    if connection.in_atomic_block:
+        pending = next((func for _, func, _ in connection.run_on_commit if isinstance(func, PendingLines)), None)
+    registered = pending is not None
+    pending = pending or PendingLines()
+    # Retraits d'abord : une modification retire l'ancienne ligne puis ajoute la nouvelle
+    pending.events.extend((True, line) for line in removed)
+    pending.events.extend((False, line) for line in added)
+    if not registered:
+        # Hors transaction, exécuté immédiatement
+        transaction.on_commit(pending)
+
+
+def _publish(task_name, designations, fallback=None):
+    """Publie la tâche sans nouvelle tentative : un broker indisponible ne bloque pas la requête"""
+    from . import tasks
+    if not designations:
+        return
+    try:
+        getattr(tasks, task_name).apply_async((sorted(designations),), retry=False)
+    except Exception as e:
+        if fallback is None:
+            # Médianes rattrapées par la prochaine mise à jour ou par rebuild_quote_catalog
+            print(f"Catalogue : file Celery indisponible, {task_name} non exécutée ({e})")
+        else:
+            print(f"Catalogue : file Celery indisponible, recalcul immédiat ({e})")
+            fallback(designations)
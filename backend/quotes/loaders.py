@@ -0,0 +1,48 @@
+"""
+Chargement d'un devis ou d'un tracking avec tous ses groupes et lignes en un nombre
+fixe de requêtes (groupes, lignes des groupes, lignes sans groupe).
+
+Les lignes de chaque groupe sont préchargées : group.lines.all() (PDF, serializers)
+ne fait plus aucune requête, et les sous-totaux / nombres de lignes des groupes sont
+calculés en SQL (with_totals) dans la requête des groupes.
+"""
+from django.db.models import Prefetch
+
+
+class LineTree:
+    """Arbre en mémoire d'un devis ou d'un tracking : groupes ordonnés et lignes sans groupe"""
+
+    def __init__(self, groups, ungrouped_lines):
+        self.groups = groups
+        self.ungrouped_lines = ungrouped_lines
+
+    @property
+    def has_groups(self):
+        return bool(self.groups)
+
+    @property
+    def lines(self):
+        """Toutes les lignes : sans groupe d'abord, puis celles de chaque groupe"""
+        lines = list(self.ungrouped_lines)
+        for group in self.groups:
+            lines.extend(group.lines.all())
+        return lines
+
+
+def _load_tree(groups, lines):
+    ordered_lines = lines.order_by('id')
+    groups = list(groups.with_totals().prefetch_related(
+        Prefetch('lines', queryset=ordered_lines.filter(group__isnull=False))
+    ))
+    ungrouped_lines = list(ordered_lines.filter(group__isnull=True))
+    return LineTree(groups, ungrouped_lines)
+
+
+def load_quote_tree(quote):
+    """Groupes (ordre, id) et lignes d'un devis en 3 requêtes"""
+    return _load_tree(quote.groups.all(), quote.lines.all())
+
+
+def load_tracking_tree(tracking):
+    """Groupes (ordre, id) et lignes d'un tracking en 3 requêtes"""
+    return _load_tree(tracking.groups.all(), tracking.lines.all())
@@ -0,0 +1,38 @@
+"""
+Reconstruit le catalogue des désignations (CatalogItem) à partir de toutes les lignes de devis.
+
+    python manage.py rebuild_quote_catalog
+
+Le catalogue est ensuite tenu à jour à chaque écriture de lignes ; la reconstruction
+sert au premier remplissage et après des suppressions en masse hors application.
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from quotes.catalog import items_from_rows, upsert
+from quotes.models import CatalogItem, QuoteLine
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Reconstruit le catalogue d'autocomplétion des désignations de lignes de devis"
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        rows = QuoteLine.objects.order_by('designation', 'id') \
+            .values_list('designation', 'prix_unitaire', 'id').iterator(chunk_size=5000)
+
+        count, batch = 0, []
+        for item in items_from_rows(rows):
+            batch.append(item)
+            if len(batch) >= BATCH_SIZE:
+                upsert(batch, BATCH_SIZE)
+                count += len(batch)
+                batch = []
+        upsert(batch, BATCH_SIZE)
+        count += len(batch)
+
+        # Entrées non rafraîchies : désignations qui ne sont plus utilisées
+        removed, _ = CatalogItem.objects.filter(updated_at__lt=started).delete()
+        self.stdout.write(self.style.SUCCESS(f"{count} désignation(s) au catalogue, {removed} supprimée(s)"))
@@ -10,6 +10,8 @@ class Migration(migrations.Migration):
 
     dependencies = [
         ('projects', '0001_initial'),
+        # Clé primaire définitive de PROJECTS avant la création de la clé étrangère (SQLite)
+        ('projects', '0002_remove_expense_id_remove_project_id_and_more'),
     ]
 
     operations = [
@@ -0,0 +1,131 @@
+# Index de recherche plein texte des devis (voir quotes/search.py)
+#  - PostgreSQL : index GIN trigrammes (fragments, ILIKE) et tsvector 'french'
+#  - SQLite : table FTS5 quote_search alimentée par triggers
+# Les autres moteurs n'ont pas d'index dédié (recherche par icontains).
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS quote_lines_designation_trgm ON "QUOTE_LINES" USING gin (designation gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS quote_lines_designation_fts ON "QUOTE_LINES" USING gin (to_tsvector(\'french\', designation))',
+    'CREATE INDEX IF NOT EXISTS quotes_numero_devis_trgm ON "QUOTES" USING gin (numero_devis gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS quotes_objet_trgm ON "QUOTES" USING gin (objet gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS quotes_objet_fts ON "QUOTES" USING gin (to_tsvector(\'french\', objet))',
+    'CREATE INDEX IF NOT EXISTS quote_tracking_bl_number_trgm ON "QUOTE_TRACKING" USING gin (bl_number gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS quote_tracking_bc_number_trgm ON "QUOTE_TRACKING" USING gin (bc_number gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS quote_tracking_invoice_number_trgm ON "QUOTE_TRACKING" USING gin (invoice_number gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS clients_nom_client_trgm ON "CLIENTS" USING gin (nom_client gin_trgm_ops)',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS quote_lines_designation_trgm',
+    'DROP INDEX IF EXISTS quote_lines_designation_fts',
+    'DROP INDEX IF EXISTS quotes_numero_devis_trgm',
+    'DROP INDEX IF EXISTS quotes_objet_trgm',
+    'DROP INDEX IF EXISTS quotes_objet_fts',
+    'DROP INDEX IF EXISTS quote_tracking_bl_number_trgm',
+    'DROP INDEX IF EXISTS quote_tracking_bc_number_trgm',
+    'DROP INDEX IF EXISTS quote_tracking_invoice_number_trgm',
+    'DROP INDEX IF EXISTS clients_nom_client_trgm',
+]
+
+# rowid FTS5 = id * 4 + source : 0 devis, 1 ligne, 2 tracking, 3 client du devis
+# (suppression par rowid, sans parcours de la table)
+SQLITE_QUOTE_ROWS = '''
+    INSERT INTO quote_search(rowid, body, quote_id, source)
+        VALUES (NEW.id_quote * 4, NEW.numero_devis || ' ' || NEW.objet, NEW.id_quote, 'quote');
+    INSERT INTO quote_search(rowid, body, quote_id, source)
+        SELECT NEW.id_quote * 4 + 3, c.nom_client, NEW.id_quote, 'client'
+        FROM "PROJECTS" p JOIN "CLIENTS" c ON c.id_client = p.id_client
+        WHERE p.id_project = NEW.id_project;
+'''
+
+SQLITE_CLIENT_ROWS = '''
+    DELETE FROM quote_search WHERE rowid IN (
+        SELECT q.id_quote * 4 + 3 FROM "QUOTES" q {join} WHERE {where}
+    );
+    INSERT INTO quote_search(rowid, body, quote_id, source)
+        SELECT q.id_quote * 4 + 3, c.nom_client, q.id_quote, 'client'
+        FROM "QUOTES" q JOIN "PROJECTS" p ON p.id_project = q.id_project
+        JOIN "CLIENTS" c ON c.id_client = p.id_client
+        WHERE {where};
+'''
+
+SQLITE_TRACKING_BODY = "coalesce(NEW.bl_number, '') || ' ' || coalesce(NEW.bc_number, '') || ' ' || coalesce(NEW.invoice_number, '')"
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE quote_search USING fts5("
+    "body, quote_id UNINDEXED, source UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')",
+
+    # Devis et client du devis
+    f'CREATE TRIGGER quote_search_quote_ai AFTER INSERT ON "QUOTES" BEGIN {SQLITE_QUOTE_ROWS} END',
+    'CREATE TRIGGER quote_search_quote_au AFTER UPDATE OF numero_devis, objet, id_project ON "QUOTES" BEGIN '
+    'DELETE FROM quote_search WHERE rowid IN (OLD.id_quote * 4, OLD.id_quote * 4 + 3); '
+    f'{SQLITE_QUOTE_ROWS} END',
+    'CREATE TRIGGER quote_search_quote_ad AFTER DELETE ON "QUOTES" BEGIN '
+    'DELETE FROM quote_search WHERE rowid IN (OLD.id_quote * 4, OLD.id_quote * 4 + 3); END',
+    'CREATE TRIGGER quote_search_client_au AFTER UPDATE OF nom_client ON "CLIENTS" BEGIN '
+    + SQLITE_CLIENT_ROWS.format(
+        join='JOIN "PROJECTS" p ON p.id_project = q.id_project', where='p.id_client = NEW.id_client'
+    ) + ' END',
+    'CREATE TRIGGER quote_search_project_au AFTER UPDATE OF id_client ON "PROJECTS" BEGIN '
+    + SQLITE_CLIENT_ROWS.format(join='', where='q.id_project = NEW.id_project') + ' END',
+
+    # Lignes
+    'CREATE TRIGGER quote_search_line_ai AFTER INSERT ON "QUOTE_LINES" BEGIN '
+    "INSERT INTO quote_search(rowid, body, quote_id, source) VALUES (NEW.id * 4 + 1, NEW.designation, NEW.id_quote, 'line'); END",
+    'CREATE TRIGGER quote_search_line_au AFTER UPDATE OF designation ON "QUOTE_LINES" BEGIN '
+    'DELETE FROM quote_search WHERE rowid = OLD.id * 4 + 1; '
+    "INSERT INTO quote_search(rowid, body, quote_id, source) VALUES (NEW.id * 4 + 1, NEW.designation, NEW.id_quote, 'line'); END",
+    'CREATE TRIGGER quote_search_line_ad AFTER DELETE ON "QUOTE_LINES" BEGIN '
+    'DELETE FROM quote_search WHERE rowid = OLD.id * 4 + 1; END',
+
+    # Numéros BL / BC / facture
+    'CREATE TRIGGER quote_search_tracking_ai AFTER INSERT ON "QUOTE_TRACKING" BEGIN '
+    f"INSERT INTO quote_search(rowid, body, quote_id, source) VALUES (NEW.id * 4 + 2, {SQLITE_TRACKING_BODY}, NEW.id_quote, 'tracking'); END",
+    'CREATE TRIGGER quote_search_tracking_au AFTER UPDATE OF bl_number, bc_number, invoice_number, id_quote ON "QUOTE_TRACKING" BEGIN '
+    'DELETE FROM quote_search WHERE rowid = OLD.id * 4 + 2; '
+    f"INSERT INTO quote_search(rowid, body, quote_id, source) VALUES (NEW.id * 4 + 2, {SQLITE_TRACKING_BODY}, NEW.id_quote, 'tracking'); END",
+    'CREATE TRIGGER quote_search_tracking_ad AFTER DELETE ON "QUOTE_TRACKING" BEGIN '
+    'DELETE FROM quote_search WHERE rowid = OLD.id * 4 + 2; END',
+
+    # Données existantes
+    "INSERT INTO quote_search(rowid, body, quote_id, source) "
+    "SELECT id_quote * 4, numero_devis || ' ' || objet, id_quote, 'quote' FROM \"QUOTES\"",
+    "INSERT INTO quote_search(rowid, body, quote_id, source) "
+    "SELECT q.id_quote * 4 + 3, c.nom_client, q.id_quote, 'client' FROM \"QUOTES\" q "
+    "JOIN \"PROJECTS\" p ON p.id_project = q.id_project JOIN \"CLIENTS\" c ON c.id_client = p.id_client",
+    "INSERT INTO quote_search(rowid, body, quote_id, source) "
+    "SELECT id * 4 + 1, designation, id_quote, 'line' FROM \"QUOTE_LINES\"",
+    "INSERT INTO quote_search(rowid, body, quote_id, source) "
+    f"SELECT id * 4 + 2, {SQLITE_TRACKING_BODY.replace('NEW.', '')}, id_quote, 'tracking' FROM \"QUOTE_TRACKING\"",
+]
+
+SQLITE_BACKWARD = [
+    f'DROP TRIGGER IF EXISTS quote_search_{name}'
+    for name in ('quote_ai', 'quote_au', 'quote_ad', 'client_au', 'project_au',
+                 'line_ai', 'line_au', 'line_ad', 'tracking_ai', 'tracking_au', 'tracking_ad')
+] + ['DROP TABLE IF EXISTS quote_search']
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0018_remove_quoteline_remise_and_more'),
+        ('clients', '0004_client_ice'),
+        ('projects', '0010_make_date_fin_optional'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0019_quote_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('designation', models.CharField(max_length=255, unique=True)),
+                ('key', models.CharField(db_index=True, max_length=255)),
+                ('usage_count', models.PositiveIntegerField(default=0)),
+                ('last_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('median_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'QUOTE_CATALOG',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='quoteline',
+            index=models.Index(fields=['designation'], name='quote_lines_designation_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0020_quote_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogitem',
+            name='last_line_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
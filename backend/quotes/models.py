@@ -1,4 +1,9 @@
-from django.db import models
+import copy
+import unicodedata
+from decimal import Decimal
+from django.db import connection, models, transaction
+from django.db.models import Count, DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
 from projects.models import Project
 
 class Quote(models.Model):
@@ -15,10 +20,10 @@ class Quote(models.Model):
     class Meta:
         db_table = 'QUOTES'
 
-    def calculate_totals(self):
-        lines = self.lines.all()
+    def compute_totals(self):
+        """Calcule total_ht / total_ttc à partir d'un SUM SQL des lignes (sans les enregistrer)"""
         # Somme des montants HT des lignes (sans remise individuelle)
-        total_lines_ht = sum(line.montant_ht for line in lines)
+        total_lines_ht = self.lines.aggregate(total=Sum('montant_ht'))['total'] or Decimal('0')
         
         # Application de la remise globale
         if self.remise > 0:
@@ -28,14 +33,143 @@ class Quote(models.Model):
             self.total_ht = total_lines_ht
             
         self.total_ttc = self.total_ht * (1 + self.tva / 100)
-        self.save()
 
-class QuoteGroup(models.Model):
+    @transaction.atomic
+    def calculate_totals(self):
+        """Recalcule et enregistre les totaux sous verrou du devis (les autres champs ne sont pas réécrits)"""
+        quote = Quote.lock(self.pk)
+        quote.update_totals()
+        self.total_ht, self.total_ttc = quote.total_ht, quote.total_ttc
+
+    def update_totals(self):
+        """
+        Recalcule les totaux et ne les enregistre que s'ils ont changé (appelé sous verrou
+        sur une instance relue, voir Quote.lock) : une ligne modifiée sans effet sur les
+        montants ne déclenche ni écriture ni rafraîchissement du tableau de bord.
+        """
+        before = self.rounded_totals()
+        self.compute_totals()
+        if self.rounded_totals() != before:
+            self.save(update_fields=['total_ht', 'total_ttc'])
+
+    def rounded_totals(self):
+        """Totaux à la précision enregistrée en base"""
+        return tuple(Decimal(value).quantize(Decimal('0.01')) for value in (self.total_ht, self.total_ttc))
+
+    @staticmethod
+    def lock(quote_id):
+        """
+        Verrouille le devis (SELECT ... FOR UPDATE) jusqu'à la fin de la transaction en cours.
+        Les modifications de lignes d'un même devis sont ainsi sérialisées et le SUM des
+        totaux voit toujours les lignes des transactions concurrentes déjà validées.
+        """
+        return Quote.objects.select_for_update().get(pk=quote_id)
+
+    @transaction.atomic
+    def add_lines(self, lines_data, batch_size=500):
+        """Insère des lignes en masse (bulk_create, montant_ht calculé en lot) puis recalcule les totaux une seule fois"""
+        quote = Quote.lock(self.pk)
+        lines = []
+        for line_data in lines_data:
+            # Les lignes sont toujours créées : un éventuel id reçu est ignoré
+            line_data = {k: v for k, v in line_data.items() if k != 'id'}
+            line = QuoteLine(quote=self, **line_data)
+            line.montant_ht = line.quantite * line.prix_unitaire
+            lines.append(line)
+        lines = QuoteLine.objects.bulk_create(lines, batch_size=batch_size)
+        from .catalog import schedule_update
+        schedule_update(added=[line.catalog_values() for line in lines])
+        quote.update_totals()
+        self.total_ht, self.total_ttc = quote.total_ht, quote.total_ttc
+        return lines
+
+    @transaction.atomic
+    def sync_lines(self, lines_data, batch_size=500):
+        """
+        Aligne les lignes du devis sur la liste complète reçue : les lignes dont l'id existe
+        sont mises à jour (bulk_update, uniquement si elles ont changé), les autres créées
+        (bulk_create) et les lignes absentes supprimées. Le suivi des modifications
+        (change_status, original_*) suit les mêmes règles que QuoteLine.save.
+        """
+        quote = Quote.lock(self.pk)
+        existing = {line.pk: line for line in self.lines.all()}
+        kept, to_update, to_create = set(), [], []
+        # Lignes ajoutées / retirées du catalogue (id, désignation, prix) ; les lignes
+        # supprimées passent par le signal post_delete
+        added, removed_lines = [], []
+
+        for line_data in lines_data:
+            line_data = dict(line_data)
+            line = existing.get(line_data.pop('id', None))
+            if line is None:
+                line = QuoteLine(quote=self, **line_data)
+                line.montant_ht = line.quantite * line.prix_unitaire
+                to_create.append(line)
+                continue
+
+            kept.add(line.pk)
+            before = line.sync_values()
+            old_line = copy.copy(line)
+            for attr, value in line_data.items():
+                setattr(line, attr, value)
+            line.track_changes(old_line)
+            line.montant_ht = line.quantite * line.prix_unitaire
+            if line.sync_values() != before:
+                to_update.append(line)
+            if old_line.catalog_values() != line.catalog_values():
+                removed_lines.append(old_line.catalog_values())
+                added.append(line.catalog_values())
+
+        removed = set(existing) - kept
+        if removed:
+            QuoteLine.objects.filter(pk__in=removed).delete()
+        QuoteLine.objects.bulk_update(to_update, QuoteLine.SYNC_FIELDS, batch_size=batch_size)
+        QuoteLine.objects.bulk_create(to_create, batch_size=batch_size)
+        added.extend(line.catalog_values() for line in to_create)
+        from .catalog import schedule_update
+        schedule_update(added, removed_lines)
+
+        quote.update_totals()
+        self.total_ht, self.total_ttc = quote.total_ht, quote.total_ttc
+        return {'created': len(to_create), 'updated': len(to_update), 'deleted': len(removed)}
+
+class LineGroupQuerySet(models.QuerySet):
+    """Groupes de lignes (devis ou tracking)"""
+
+    def with_totals(self):
+        """Sous-total HT (lines_total_ht) et nombre de lignes (line_count) calculés en SQL"""
+        return self.annotate(
+            lines_total_ht=Coalesce(
+                Sum('lines__montant_ht'), Value(Decimal('0')),
+                output_field=DecimalField(max_digits=15, decimal_places=2)
+            ),
+            line_count=Count('lines'),
+        )
+
+
+class LineGroupTotalsMixin:
+    """Sous-total et nombre de lignes : valeurs annotées (with_totals) sinon calcul sur les lignes"""
+
+    def get_total(self):
+        """Calcule le total HT des lignes du groupe"""
+        if hasattr(self, 'lines_total_ht'):
+            return self.lines_total_ht
+        return sum(line.montant_ht for line in self.lines.all())
+
+    def get_line_count(self):
+        if hasattr(self, 'line_count'):
+            return self.line_count
+        return len(self.lines.all())
+
+
+class QuoteGroup(LineGroupTotalsMixin, models.Model):
     """Groupe/Section pour organiser les lignes de devis"""
     quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='groups')
     name = models.CharField(max_length=255)
     order = models.PositiveIntegerField(default=0)
 
+    objects = LineGroupQuerySet.as_manager()
+
     class Meta:
         db_table = 'QUOTE_GROUPS'
         ordering = ['order', 'id']
@@ -43,10 +177,6 @@ class QuoteGroup(models.Model):
     def __str__(self):
         return f"{self.quote.numero_devis} - {self.name}"
 
-    def get_total(self):
-        """Calcule le total HT des lignes du groupe"""
-        return sum(line.montant_ht for line in self.lines.all())
-
 
 class QuoteLine(models.Model):
     CHANGE_STATUS_CHOICES = [
@@ -81,24 +211,48 @@ class QuoteLine(models.Model):
     original_quantite = models.IntegerField(blank=True, null=True)
     original_prix_unitaire = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
 
+    # Champs écrits par Quote.sync_lines (bulk_update)
+    SYNC_FIELDS = [
+        'group', 'designation', 'quantite', 'prix_unitaire', 'montant_ht',
+        'change_status', 'original_designation', 'original_quantite', 'original_prix_unitaire',
+    ]
+
     class Meta:
         db_table = 'QUOTE_LINES'
+        # Agrégats du catalogue par désignation (quotes/catalog.py)
+        indexes = [models.Index(fields=['designation'], name='quote_lines_designation_idx')]
+
+    def sync_values(self):
+        return [getattr(self, self._meta.get_field(field).attname) for field in self.SYNC_FIELDS]
+
+    def catalog_values(self):
+        """(id, désignation, prix tel qu'enregistré) pour quotes.catalog.schedule_update"""
+        return self.pk, self.designation, Decimal(self.prix_unitaire).quantize(Decimal('0.01'))
+
+    def track_changes(self, old_line):
+        """Marque la ligne comme modifiée par rapport à old_line (valeurs originales conservées)"""
+        # Vérifier si des champs ont changé
+        if (old_line.designation != self.designation or 
+            old_line.quantite != self.quantite or 
+            old_line.prix_unitaire != self.prix_unitaire):
+            # Marquer comme modifié et sauvegarder les valeurs originales si pas déjà fait
+            if self.change_status == 'unchanged':
+                self.change_status = 'modified'
+                self.original_designation = old_line.designation
+                self.original_quantite = old_line.quantite
+                self.original_prix_unitaire = old_line.prix_unitaire
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
+        # Verrou du devis : les totaux restent justes si deux utilisateurs modifient ses lignes
+        quote = Quote.lock(self.quote_id)
+
         # Détecter les modifications pour le suivi visuel
+        old_line = None
         if self.pk:  # Si la ligne existe déjà
             try:
                 old_line = QuoteLine.objects.get(pk=self.pk)
-                # Vérifier si des champs ont changé
-                if (old_line.designation != self.designation or 
-                    old_line.quantite != self.quantite or 
-                    old_line.prix_unitaire != self.prix_unitaire):
-                    # Marquer comme modifié et sauvegarder les valeurs originales si pas déjà fait
-                    if self.change_status == 'unchanged':
-                        self.change_status = 'modified'
-                        self.original_designation = old_line.designation
-                        self.original_quantite = old_line.quantite
-                        self.original_prix_unitaire = old_line.prix_unitaire
+                self.track_changes(old_line)
             except QuoteLine.DoesNotExist:
                 pass
         
@@ -108,7 +262,73 @@ class QuoteLine(models.Model):
         
         self.montant_ht = self.quantite * self.prix_unitaire
         super().save(*args, **kwargs)
-        self.quote.calculate_totals()
+        self._update_quote_totals(quote)
+        from .catalog import schedule_update
+        if old_line is None:
+            schedule_update(added=[self.catalog_values()])
+        elif old_line.catalog_values() != self.catalog_values():
+            schedule_update(added=[self.catalog_values()], removed=[old_line.catalog_values()])
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        quote = Quote.lock(self.quote_id)
+        # Catalogue : retrait par le signal post_delete (quotes/signals.py)
+        result = super().delete(*args, **kwargs)
+        self._update_quote_totals(quote)
+        return result
+
+    def _update_quote_totals(self, quote):
+        """SUM SQL des lignes sous verrou : nombre de requêtes constant quelle que soit la taille du devis"""
+        quote.update_totals()
+        if QuoteLine.quote.is_cached(self):
+            self.quote.total_ht, self.quote.total_ttc = quote.total_ht, quote.total_ttc
+
+def catalog_key(designation):
+    """Clé d'autocomplétion : minuscules, sans accents, espaces normalisés"""
+    text = unicodedata.normalize('NFKD', designation)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())[:255]
+
+
+class CatalogQuerySet(models.QuerySet):
+
+    def autocomplete(self, term, limit=10):
+        """Entrées dont la clé commence par le terme (index sur key), les plus utilisées d'abord"""
+        prefix = catalog_key(term)
+        if connection.vendor == 'postgresql':
+            # LIKE 'préfixe%' : index varchar_pattern_ops (key_like) créé par Django
+            matches = self.filter(key__startswith=prefix)
+        else:
+            # SQLite n'utilise pas l'index pour LIKE : intervalle équivalent sur la clé
+            matches = self.filter(key__gte=prefix, key__lt=prefix + '\U0010ffff')
+        return matches.order_by('-usage_count', 'key')[:limit]
+
+
+class CatalogItem(models.Model):
+    """
+    Catalogue des désignations déjà utilisées dans les lignes de devis avec leurs
+    statistiques de prix unitaire, pour l'autocomplétion à la saisie des lignes.
+    Tenu à jour à chaque écriture de lignes et reconstruit par rebuild_quote_catalog
+    (voir quotes/catalog.py).
+    """
+    designation = models.CharField(max_length=255, unique=True)
+    key = models.CharField(max_length=255, db_index=True)
+    usage_count = models.PositiveIntegerField(default=0)
+    last_price = models.DecimalField(max_digits=12, decimal_places=2)
+    last_line_id = models.IntegerField(null=True, blank=True)  # Ligne du dernier prix
+    median_price = models.DecimalField(max_digits=12, decimal_places=2)
+    min_price = models.DecimalField(max_digits=12, decimal_places=2)
+    max_price = models.DecimalField(max_digits=12, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CatalogQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'QUOTE_CATALOG'
+
+    def __str__(self):
+        return self.designation
+
 
 class QuoteTracking(models.Model):
     quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='trackings', db_column='id_quote')
@@ -121,12 +341,14 @@ class QuoteTracking(models.Model):
     class Meta:
         db_table = 'QUOTE_TRACKING'
 
-class QuoteTrackingGroup(models.Model):
+class QuoteTrackingGroup(LineGroupTotalsMixin, models.Model):
     """Groupe/Section pour organiser les lignes de suivi de devis"""
     tracking = models.ForeignKey(QuoteTracking, on_delete=models.CASCADE, related_name='groups')
     name = models.CharField(max_length=255)
     order = models.PositiveIntegerField(default=0)
 
+    objects = LineGroupQuerySet.as_manager()
+
     class Meta:
         db_table = 'QUOTE_TRACKING_GROUPS'
         ordering = ['order', 'id']
@@ -134,10 +356,6 @@ class QuoteTrackingGroup(models.Model):
     def __str__(self):
         return f"Tracking {self.tracking.id} - {self.name}"
 
-    def get_total(self):
-        """Calcule le total HT des lignes du groupe"""
-        return sum(line.montant_ht for line in self.lines.all())
-
 
 class QuoteTrackingLine(models.Model):
     CHANGE_STATUS_CHOICES = [
@@ -0,0 +1,350 @@
+"""
+Modèles de documents (devis, bon de livraison, facture) pour le moteur PDF commun.
+
+Chaque builder transforme un devis ou un tracking en LineDocument ; le rendu
+ReportLab est entièrement délégué à core.pdf_engine.
+"""
+from core.pdf_assets import get_branding_asset, HEADER_IMAGE, FOOTER_IMAGE, SIGNATURE_IMAGE
+from .loaders import load_quote_tree, load_tracking_tree
+from core.pdf_engine import LineDocument, LineSection, render_line_document, totals_rows
+from decimal import Decimal
+from datetime import datetime
+import hashlib
+
+def number_to_words_fr(number):
+    """Convert a number to French words for invoice amounts."""
+    units = ["", "un", "deux", "trois", "quatre", "cinq", "six", "sept", "huit", "neuf"]
+    teens = ["dix", "onze", "douze", "treize", "quatorze", "quinze", "seize", "dix-sept", "dix-huit", "dix-neuf"]
+    tens = ["", "dix", "vingt", "trente", "quarante", "cinquante", "soixante", "soixante", "quatre-vingt", "quatre-vingt"]
+    
+    def convert_below_thousand(n):
+        if n == 0:
+            return ""
+        elif n < 10:
+            return units[n]
+        elif n < 20:
+            return teens[n - 10]
+        elif n < 70:
+            unit = n % 10
+            ten = n // 10
+            if unit == 0:
+                return tens[ten]
+            elif unit == 1 and ten in [2, 3, 4, 5, 6]:
+                return tens[ten] + "-et-un"
+            else:
+                return tens[ten] + "-" + units[unit]
+        elif n < 80:
+            return "soixante-" + teens[n - 70]
+        elif n < 100:
+            unit = n % 10
+            if n == 80:
+                return "quatre-vingts"
+            elif unit == 0:
+                return "quatre-vingt"
+            else:
+                return "quatre-vingt-" + units[unit] if n < 90 else "quatre-vingt-" + teens[n - 90]
+        else:
+            hundreds = n // 100
+            remainder = n % 100
+            if hundreds == 1:
+                hundred_word = "cent"
+            else:
+                hundred_word = units[hundreds] + " cent"
+            if remainder == 0 and hundreds > 1:
+                hundred_word += "s"
+            if remainder > 0:
+                return hundred_word + " " + convert_below_thousand(remainder)
+            return hundred_word
+    
+    # Handle decimal number
+    integer_part = int(number)
+    decimal_part = int(round((number - integer_part) * 100))
+    
+    if integer_part == 0:
+        result = "zéro"
+    elif integer_part < 1000:
+        result = convert_below_thousand(integer_part)
+    elif integer_part < 1000000:
+        thousands = integer_part // 1000
+        remainder = integer_part % 1000
+        if thousands == 1:
+            result = "mille"
+        else:
+            result = convert_below_thousand(thousands) + " mille"
+        if remainder > 0:
+            result += " " + convert_below_thousand(remainder)
+    elif integer_part < 1000000000:
+        millions = integer_part // 1000000
+        remainder = integer_part % 1000000
+        if millions == 1:
+            result = "un million"
+        else:
+            result = convert_below_thousand(millions) + " millions"
+        if remainder >= 1000:
+            thousands = remainder // 1000
+            if thousands == 1:
+                result += " mille"
+            else:
+                result += " " + convert_below_thousand(thousands) + " mille"
+            remainder = remainder % 1000
+        if remainder > 0:
+            result += " " + convert_below_thousand(remainder)
+    else:
+        result = str(integer_part)
+    
+    # Capitalize first letter
+    result = result.strip().capitalize()
+    
+    return f"{result} Dirhams {decimal_part:02d} CTS"
+
+
+def _client_info(quote):
+    """Colonne droite du bloc d'informations : Client, Adresse, ICE"""
+    client = quote.project.client if quote.project else None
+    client_name = client.nom_client if client else "Client Inconnu"
+    client_address = client.adresse if client and client.adresse else ""
+    client_ice = client.ice if client and client.ice else ""
+
+    info_right = [f"<b>Client :</b> {client_name}"]
+    if client_address:
+        info_right.append(f"Adresse : {client_address}")
+    if client_ice:
+        info_right.append(f"ICE : {client_ice}")
+    return info_right
+
+
+def get_delivery_note_number(quote, tracking):
+    return tracking.bl_number if tracking.bl_number else f"BL-{quote.numero_devis}"
+
+
+def get_invoice_number(quote, tracking):
+    return tracking.invoice_number if tracking.invoice_number else f"FACTURE-{quote.numero_devis}"
+
+
+def build_quote_document(quote):
+    formatted_date = quote.date_livraison.strftime('%d/%m/%Y') if quote.date_livraison else datetime.now().strftime('%d/%m/%Y')
+    info_left = [
+        f"<b>Date :</b> {formatted_date}",
+        f"<b>Devis N° :</b> {quote.numero_devis}",
+        f"<b>Objet :</b> {quote.objet}",
+    ]
+
+    def line_row(line):
+        return (line.designation, line.quantite, line.prix_unitaire, line.montant_ht)
+
+    tree = load_quote_tree(quote)
+    sections = []
+    if not tree.has_groups:
+        # Legacy / Flat behavior
+        sections.append(LineSection([line_row(line) for line in tree.ungrouped_lines]))
+    else:
+        # Grouped behavior: ungrouped lines first, then each group with its subtotal
+        if tree.ungrouped_lines:
+            sections.append(LineSection([line_row(line) for line in tree.ungrouped_lines], title="Divers / Général"))
+        for group in sorted(tree.groups, key=lambda g: g.id):
+            rows = [line_row(line) for line in group.lines.all()]
+            sections.append(LineSection(rows, title=group.name, subtotal=group.get_total()))
+
+    # Le montant stocké dans quote.total_ht est déjà le montant net (après remise)
+    total_ht = float(quote.total_ht)
+    # Recalculer le Total HT brut (avant remise) pour l'affichage
+    lines_total_ht = float(sum(line.montant_ht for line in tree.lines))
+    tva_amount = total_ht * (float(quote.tva) / 100)
+    total_ttc = float(quote.total_ttc)
+
+    totals = totals_rows(
+        quote.remise, quote.tva,
+        total_ht_gross=lines_total_ht,
+        montant_remise=lines_total_ht * (float(quote.remise) / 100),
+        total_ht_net=total_ht,
+        tva_amount=tva_amount,
+        total_ttc=total_ttc,
+    )
+
+    return LineDocument(
+        info_left, _client_info(quote), sections, totals,
+        price_headers=('P.U. (DH)', 'Total (DH)'),
+        closing_text=f"Arrêté le présent devis à la somme de : <b>{total_ttc:,.2f} Dirhams TTC</b>",
+        signature=LineDocument.SIGNATURE_STAMP,
+    )
+
+
+def _tracking_sections(tracking):
+    """Sections du tableau à partir des lignes de tracking (groupes d'abord, puis Divers / Général)"""
+    tree = load_tracking_tree(tracking)
+    total_ht_calc = 0
+
+    def line_row(line):
+        nonlocal total_ht_calc
+        montant_ht = line.quantite * line.prix_unitaire
+        total_ht_calc += montant_ht
+        return (line.designation, line.quantite, line.prix_unitaire, montant_ht)
+
+    sections = []
+    if not tree.has_groups:
+        sections.append(LineSection([line_row(line) for line in tree.ungrouped_lines]))
+    else:
+        for group in tree.groups:
+            sections.append(LineSection([line_row(line) for line in group.lines.all()], title=group.name))
+        if tree.ungrouped_lines:
+            sections.append(LineSection([line_row(line) for line in tree.ungrouped_lines], title="Divers / Général"))
+    return sections, total_ht_calc
+
+
+def _tracking_totals(quote, total_ht_gross):
+    """Applique la remise et la TVA du devis au total HT des lignes de tracking"""
+    montant_remise = total_ht_gross * (Decimal(quote.remise or 0) / 100)
+    total_ht_net = total_ht_gross - montant_remise
+    tva_amount = total_ht_net * (Decimal(quote.tva) / 100)
+    total_ttc = total_ht_net + tva_amount
+
+    totals = totals_rows(
+        quote.remise, quote.tva,
+        total_ht_gross=total_ht_gross,
+        montant_remise=montant_remise,
+        total_ht_net=total_ht_net,
+        tva_amount=tva_amount,
+        total_ttc=total_ttc,
+    )
+    return totals, total_ttc
+
+
+def _tracking_info_left(quote, tracking, number_label, number):
+    info_left = [
+        f"<b>Date :</b> {datetime.now().strftime('%d/%m/%Y')}",
+        f"<b>{number_label} :</b> {number}",
+    ]
+    if tracking.bc_number:
+        info_left.append(f"<b>N° BC :</b> {tracking.bc_number}")
+    info_left.append(f"<b>Objet :</b> {quote.objet}")
+    return info_left
+
+
+def build_delivery_note_document(quote, tracking):
+    sections, total_ht_calc = _tracking_sections(tracking)
+    totals, _ = _tracking_totals(quote, total_ht_calc)
+    return LineDocument(
+        _tracking_info_left(quote, tracking, "N° BL", get_delivery_note_number(quote, tracking)),
+        _client_info(quote), sections, totals,
+        price_headers=('P.U (HT)', 'Total (HT)'),
+        signature=LineDocument.SIGNATURE_PARTIES,
+    )
+
+
+def build_invoice_document(quote, tracking):
+    sections, total_ht_calc = _tracking_sections(tracking)
+    totals, total_ttc = _tracking_totals(quote, total_ht_calc)
+    amount_in_words = number_to_words_fr(float(total_ttc))
+    return LineDocument(
+        _tracking_info_left(quote, tracking, "N° Facture", get_invoice_number(quote, tracking)),
+        _client_info(quote), sections, totals,
+        price_headers=('P.U (HT)', 'Total (HT)'),
+        closing_text=f"Arrêtée la présente Facture à la Somme Total T.T.C de : <b>{amount_in_words} T.T.C</b>",
+        signature=LineDocument.SIGNATURE_PARTIES,
+    )
+
+
+def render_quote_pdf(quote):
+    return render_line_document(build_quote_document(quote))
+
+
+def render_delivery_note_pdf(quote, tracking):
+    return render_line_document(build_delivery_note_document(quote, tracking))
+
+
+def render_invoice_pdf(quote, tracking):
+    return render_line_document(build_invoice_document(quote, tracking))
+
+
+def _safe_filename(value):
+    return "".join(c for c in value if c.isalnum() or c in ('-', '_'))
+
+
+DOCUMENT_KINDS = ('quote', 'delivery_note', 'invoice')
+
+
+def document_names(kind, quote, tracking=None):
+    """Retourne (file_name, document_name) du PDF d'un devis, d'un BL ou d'une facture"""
+    if kind == 'quote':
+        return f"devis_{quote.numero_devis}.pdf", f"Devis {quote.numero_devis}"
+    if kind == 'delivery_note':
+        number = get_delivery_note_number(quote, tracking)
+        return f"BL_{_safe_filename(number)}.pdf", f"Bon de Livraison {number}"
+    if kind == 'invoice':
+        number = get_invoice_number(quote, tracking)
+        return f"Facture_{_safe_filename(number)}.pdf", f"Facture {number}"
+    raise ValueError(f"Type de document inconnu : {kind}")
+
+
+_BUILDERS = {
+    'quote': lambda quote, tracking: build_quote_document(quote),
+    'delivery_note': build_delivery_note_document,
+    'invoice': build_invoice_document,
+}
+
+
+def build_document(kind, quote, tracking=None):
+    """Construit le LineDocument (picklable) d'un devis, d'un BL ou d'une facture"""
+    if kind not in _BUILDERS:
+        raise ValueError(f"Type de document inconnu : {kind}")
+    return _BUILDERS[kind](quote, tracking)
+
+
+def render_document(kind, quote, tracking=None):
+    """Rend un devis, un BL ou une facture et retourne (pdf_content, file_name, document_name)"""
+    file_name, document_name = document_names(kind, quote, tracking)
+    return render_line_document(build_document(kind, quote, tracking)), file_name, document_name
+
+
+def export_jobs(quotes, kinds):
+    """
+    Documents à exporter pour l'export groupé : (file_name, LineDocument).
+
+    Les BL et factures sont construits à partir du dernier tracking du devis ;
+    les devis sans tracking n'ont ni BL ni facture et sont ignorés pour ces types.
+    """
+    for quote in quotes:
+        tracking = None
+        if 'delivery_note' in kinds or 'invoice' in kinds:
+            tracking = quote.trackings.order_by('-created_at').first()
+        for kind in kinds:
+            if kind != 'quote' and tracking is None:
+                continue
+            file_name, _ = document_names(kind, quote, tracking)
+            yield file_name, build_document(kind, quote, tracking)
+
+
+# À incrémenter à chaque changement de mise en page pour invalider les PDF stockés
+PDF_LAYOUT_VERSION = 2
+
+
+def quote_fingerprint(quote):
+    """
+    Empreinte SHA-256 de tout ce qui influence le PDF du devis : en-tête du devis,
+    client, groupes, lignes, état du suivi et images de charte.
+    """
+    digest = hashlib.sha256()
+
+    def feed(value):
+        digest.update(repr(value).encode('utf-8'))
+        digest.update(b'\x1e')
+
+    client = quote.project.client if quote.project else None
+    feed((
+        PDF_LAYOUT_VERSION,
+        quote.numero_devis, quote.objet, quote.date_livraison,
+        quote.tva, quote.remise, quote.total_ht, quote.total_ttc,
+        client.nom_client if client else None,
+        client.adresse if client else None,
+        client.ice if client else None,
+    ))
+    for row in quote.groups.order_by('id').values_list('id', 'name', 'order'):
+        feed(row)
+    for row in quote.lines.order_by('id').values_list('id', 'group_id', 'designation', 'quantite', 'prix_unitaire', 'montant_ht'):
+        feed(row)
+    for row in quote.trackings.order_by('id').values_list('id', 'updated_at'):
+        feed(row)
+    for image in (HEADER_IMAGE, FOOTER_IMAGE, SIGNATURE_IMAGE):
+        asset = get_branding_asset(image)
+        feed((image, asset.mtime if asset else None))
+    return digest.hexdigest()
@@ -0,0 +1,140 @@
+"""
+Recherche plein texte des devis : numéro, objet, client, désignations des lignes et
+numéros BL / BC / facture des trackings.
+
+Les correspondances sont agrégées par devis (meilleur score) et paginées en SQL :
+le coût dépend du nombre de résultats, pas de la taille de la table des lignes.
+ - PostgreSQL : tsvector 'french' (mots, racines) + ILIKE sur index trigrammes (fragments)
+ - SQLite : table FTS5 quote_search (migration 0019), classement bm25
+ - autres moteurs : icontains, sans classement fin
+
+Sur SQLite, une migration qui reconstruit QUOTES, QUOTE_LINES, QUOTE_TRACKING, PROJECTS
+ou CLIENTS supprime les triggers de quote_search : les recréer en rejouant la 0019.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Quote
+
+MIN_QUERY_LENGTH = 2
+
+POSTGRES_HITS = '''
+    SELECT id_quote AS quote_id, 'quote' AS source,
+           GREATEST(word_similarity(%(q)s, numero_devis), word_similarity(%(q)s, objet))
+           + ts_rank(to_tsvector('french', objet), websearch_to_tsquery('french', %(q)s)) AS score
+    FROM "QUOTES"
+    WHERE numero_devis ILIKE %(like)s OR objet ILIKE %(like)s
+       OR to_tsvector('french', objet) @@ websearch_to_tsquery('french', %(q)s)
+    UNION ALL
+    SELECT q.id_quote, 'client', word_similarity(%(q)s, c.nom_client)
+    FROM "CLIENTS" c
+    JOIN "PROJECTS" p ON p.id_client = c.id_client
+    JOIN "QUOTES" q ON q.id_project = p.id_project
+    WHERE c.nom_client ILIKE %(like)s
+    UNION ALL
+    SELECT id_quote, 'line',
+           word_similarity(%(q)s, designation)
+           + ts_rank(to_tsvector('french', designation), websearch_to_tsquery('french', %(q)s))
+    FROM "QUOTE_LINES"
+    WHERE designation ILIKE %(like)s
+       OR to_tsvector('french', designation) @@ websearch_to_tsquery('french', %(q)s)
+    UNION ALL
+    SELECT id_quote, 'tracking', 1.0::real
+    FROM "QUOTE_TRACKING"
+    WHERE bl_number ILIKE %(like)s OR bc_number ILIKE %(like)s OR invoice_number ILIKE %(like)s
+'''
+
+POSTGRES_PAGE = f'''
+    SELECT quote_id, MAX(score) AS score, string_agg(DISTINCT source, ',') AS sources
+    FROM ({POSTGRES_HITS}) hits
+    GROUP BY quote_id
+    ORDER BY score DESC, quote_id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+'''
+
+POSTGRES_COUNT = f'SELECT COUNT(DISTINCT quote_id) FROM ({POSTGRES_HITS}) hits'
+
+# rank = bm25 par défaut (plus petit = plus pertinent)
+SQLITE_PAGE = '''
+    SELECT quote_id, -MIN(rank) AS score, group_concat(DISTINCT source) AS sources
+    FROM quote_search
+    WHERE quote_search MATCH %s
+    GROUP BY quote_id
+    ORDER BY score DESC, quote_id DESC
+    LIMIT %s OFFSET %s
+'''
+
+SQLITE_COUNT = 'SELECT COUNT(DISTINCT quote_id) FROM quote_search WHERE quote_search MATCH %s'
+
+
+def fts5_query(query):
+    """
+    Requête utilisateur -> expression FTS5 : chaque terme devient une phrase en préfixe
+    ("BL-2024" -> "BL 2024"*), tous les termes sont requis. Vide si aucun mot.
+    """
+    phrases = [' '.join(re.findall(r'\w+', term)) for term in query.split()]
+    return ' '.join(f'"{phrase}"*' for phrase in phrases if phrase)
+
+
+def like_pattern(query):
+    return '%' + re.sub(r'([\\%_])', r'\\\1', query) + '%'
+
+
+class QuoteSearchResults:
+    """
+    Résultats classés d'une recherche, compatibles avec le Paginator Django :
+    count() et le découpage [début:fin] sont exécutés en SQL.
+    Chaque élément est un tuple (quote_id, score, sources).
+    """
+
+    def __init__(self, query):
+        self.query = query.strip()
+        self.vendor = connection.vendor
+        self.match = fts5_query(self.query)
+
+    def count(self):
+        if self.vendor == 'postgresql':
+            return self._fetch(POSTGRES_COUNT, self._postgres_params())[0][0]
+        if self.vendor == 'sqlite':
+            return self._fetch(SQLITE_COUNT, [self.match])[0][0] if self.match else 0
+        return self._fallback_queryset().count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        offset = index.start or 0
+        limit = (index.stop - offset) if index.stop is not None else -1
+        if self.vendor == 'postgresql':
+            limit = None if limit < 0 else limit
+            return self._fetch(POSTGRES_PAGE, {**self._postgres_params(), 'limit': limit, 'offset': offset})
+        if self.vendor == 'sqlite':
+            return self._fetch(SQLITE_PAGE, [self.match, limit, offset]) if self.match else []
+        ids = self._fallback_queryset().values_list('id_quote', flat=True)
+        ids = ids[offset:index.stop] if index.stop is not None else ids[offset:]
+        return [(quote_id, None, None) for quote_id in ids]
+
+    def _postgres_params(self):
+        return {'q': self.query, 'like': like_pattern(self.query)}
+
+    def _fetch(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _fallback_queryset(self):
+        q = self.query
+        return Quote.objects.filter(
+            Q(numero_devis__icontains=q) | Q(objet__icontains=q)
+            | Q(project__client__nom_client__icontains=q)
+            | Q(lines__designation__icontains=q)
+            | Q(trackings__bl_number__icontains=q) | Q(trackings__bc_number__icontains=q)
+            | Q(trackings__invoice_number__icontains=q)
+        ).distinct().order_by('-id_quote')
+
+
+def search_quotes(query):
+    """Recherche classée des devis (voir QuoteSearchResults)"""
+    return QuoteSearchResults(query)
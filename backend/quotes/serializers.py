@@ -1,5 +1,10 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Quote, QuoteLine, QuoteTracking, QuoteTrackingLine, QuoteGroup, QuoteTrackingGroup
+from rest_framework.validators import UniqueValidator
+from projects.models import Project
+from .models import Quote, QuoteLine, QuoteTracking, QuoteTrackingLine, QuoteGroup, QuoteTrackingGroup, CatalogItem
+from .services import clone_quote_to_tracking
+from core.serializers import DynamicFieldsMixin
 
 class QuoteTrackingLineSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,14 +17,19 @@ class QuoteTrackingGroupSerializer(serializers.ModelSerializer):
     """Serializer pour les groupes de lignes de suivi"""
     lines = QuoteTrackingLineSerializer(many=True, read_only=True)
     total_ht = serializers.SerializerMethodField()
+    # Sous-total et nombre de lignes annotés en SQL quand le queryset utilise with_totals()
+    line_count = serializers.SerializerMethodField()
     
     class Meta:
         model = QuoteTrackingGroup
-        fields = ['id', 'tracking', 'name', 'order', 'lines', 'total_ht']
+        fields = ['id', 'tracking', 'name', 'order', 'lines', 'total_ht', 'line_count']
     
     def get_total_ht(self, obj):
         return obj.get_total()
 
+    def get_line_count(self, obj):
+        return obj.get_line_count()
+
 
 class QuoteTrackingSerializer(serializers.ModelSerializer):
     lines = QuoteTrackingLineSerializer(many=True, read_only=True)
@@ -36,33 +46,8 @@ class QuoteTrackingSerializer(serializers.ModelSerializer):
         return QuoteTrackingLineSerializer(lines, many=True).data
 
     def create(self, validated_data):
-        quote = validated_data['quote']
-        tracking = QuoteTracking.objects.create(**validated_data)
-        
-        # Copy groups from the original quote
-        group_mapping = {}  # Map quote group ID to tracking group
-        for quote_group in quote.groups.all():
-            tracking_group = QuoteTrackingGroup.objects.create(
-                tracking=tracking,
-                name=quote_group.name,
-                order=quote_group.order
-            )
-            group_mapping[quote_group.id] = tracking_group
-        
-        # Copy lines from the original quote, maintaining group associations
-        for line in quote.lines.all():
-            tracking_group = None
-            if line.group:
-                tracking_group = group_mapping.get(line.group.id)
-            
-            QuoteTrackingLine.objects.create(
-                tracking=tracking,
-                group=tracking_group,
-                designation=line.designation,
-                quantite=line.quantite,
-                prix_unitaire=line.prix_unitaire
-            )
-        return tracking
+        # Copy groups and lines from the original quote
+        return clone_quote_to_tracking(**validated_data)
 
 class QuoteLineSerializer(serializers.ModelSerializer):
     class Meta:
@@ -71,21 +56,89 @@ class QuoteLineSerializer(serializers.ModelSerializer):
         read_only_fields = ('montant_ht',)
 
 
+class CatalogItemSerializer(serializers.ModelSerializer):
+    """Suggestion d'autocomplétion : désignation et prix unitaires constatés"""
+    class Meta:
+        model = CatalogItem
+        fields = ['designation', 'usage_count', 'last_price', 'median_price', 'min_price', 'max_price']
+
+
+class QuoteLineBulkSerializer(serializers.ModelSerializer):
+    """Ligne saisie en masse (lignes imbriquées du devis, /lines/bulk/) : le devis est fixé par l'appelant"""
+    # Permet de rattacher une ligne existante lors de la mise à jour du devis (sync_lines)
+    id = serializers.IntegerField(required=False)
+    # Identifiant brut : les groupes sont vérifiés en une requête par check_line_groups
+    group = serializers.IntegerField(source='group_id', required=False, allow_null=True)
+
+    class Meta:
+        model = QuoteLine
+        fields = '__all__'
+        read_only_fields = ('quote', 'montant_ht')
+
+
+def check_line_groups(lines_data, quote=None):
+    """Vérifie que les groupes référencés par les lignes appartiennent au devis"""
+    allowed = set(quote.groups.values_list('id', flat=True)) if quote else set()
+    unknown = {data['group_id'] for data in lines_data if data.get('group_id')} - allowed
+    if unknown:
+        raise serializers.ValidationError({
+            'lines': f"Groupe(s) inconnu(s) pour ce devis : {', '.join(str(g) for g in sorted(unknown))}"
+        })
+
+
 class QuoteGroupSerializer(serializers.ModelSerializer):
     """Serializer pour les groupes de lignes de devis"""
     lines = QuoteLineSerializer(many=True, read_only=True)
     total_ht = serializers.SerializerMethodField()
+    # Sous-total et nombre de lignes annotés en SQL quand le queryset utilise with_totals()
+    line_count = serializers.SerializerMethodField()
     
     class Meta:
         model = QuoteGroup
-        fields = ['id', 'quote', 'name', 'order', 'lines', 'total_ht']
+        fields = ['id', 'quote', 'name', 'order', 'lines', 'total_ht', 'line_count']
     
     def get_total_ht(self, obj):
         return obj.get_total()
 
+    def get_line_count(self, obj):
+        return obj.get_line_count()
+
+
+class QuoteSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Représentation légère d'un devis pour les listes : en-tête et totaux.
+    Lignes et groupes sont ajoutés sur demande (?expand=lines,groups,ungrouped_lines)
+    et doivent être préchargés par la vue (voir QuoteViewSet.get_queryset).
+    """
+    expandable_fields = {
+        'lines': lambda: QuoteLineSerializer(many=True, read_only=True),
+        'groups': lambda: QuoteGroupSerializer(many=True, read_only=True),
+        'ungrouped_lines': serializers.SerializerMethodField,
+    }
+
+    class Meta:
+        model = Quote
+        fields = ('id_quote', 'numero_devis', 'objet', 'date_livraison', 'tva', 'remise',
+                  'total_ht', 'total_ttc', 'project')
+        read_only_fields = fields
+
+    def get_ungrouped_lines(self, obj):
+        """Lignes sans groupe, filtrées sur les lignes préchargées"""
+        lines = [line for line in obj.lines.all() if line.group_id is None]
+        return QuoteLineSerializer(lines, many=True).data
+
+
+class QuoteDuplicateSerializer(serializers.Serializer):
+    """Paramètres de duplication d'un devis (tous optionnels)"""
+    numero_devis = serializers.CharField(
+        max_length=50, required=False, validators=[UniqueValidator(queryset=Quote.objects.all())]
+    )
+    project = serializers.PrimaryKeyRelatedField(queryset=Project.objects.all(), required=False)
+    remise = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False)
+
 
 class QuoteSerializer(serializers.ModelSerializer):
-    lines = QuoteLineSerializer(many=True, required=False)
+    lines = QuoteLineBulkSerializer(many=True, required=False)
     groups = QuoteGroupSerializer(many=True, read_only=True)
     ungrouped_lines = serializers.SerializerMethodField()
 
@@ -99,30 +152,35 @@ class QuoteSerializer(serializers.ModelSerializer):
         lines = obj.lines.filter(group__isnull=True)
         return QuoteLineSerializer(lines, many=True).data
 
+    @transaction.atomic
     def create(self, validated_data):
         lines_data = validated_data.pop('lines', [])
+        check_line_groups(lines_data)
         quote = Quote.objects.create(**validated_data)
-        for line_data in lines_data:
-            QuoteLine.objects.create(quote=quote, **line_data)
-        quote.calculate_totals()
+        quote.add_lines(lines_data)
         return quote
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         lines_data = validated_data.pop('lines', None)
-        
-        # Update quote fields
+
+        # Verrou du devis : un enregistrement de ligne concurrent ne peut pas écraser les totaux
+        Quote.lock(instance.pk)
+        # Totaux relus aussi : update_totals compare les nouveaux montants aux valeurs en base
+        instance.refresh_from_db(fields=['tva', 'remise', 'total_ht', 'total_ttc'])
+
+        # Update quote fields (seuls les champs reçus sont réécrits)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        
-        # Recalculate totals (which saves the instance) to account for changes in remise/tva
-        instance.calculate_totals()
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
 
         if lines_data is not None:
-            # Simple strategy: delete all and recreate (or handle update logic)
-            # For simplicity in this prompt, I'll delete and recreate
-            instance.lines.all().delete()
-            for line_data in lines_data:
-                QuoteLine.objects.create(quote=instance, **line_data)
-            instance.calculate_totals()
-            
+            # Upsert par id : lignes modifiées, créées et supprimées en masse (totaux inclus)
+            check_line_groups(lines_data, instance)
+            instance.sync_lines(lines_data)
+        else:
+            # Totaux recalculés pour tenir compte de remise/tva
+            instance.update_totals()
+
         return instance
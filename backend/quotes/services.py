@@ -0,0 +1,111 @@
+from django.db import transaction
+from .catalog import schedule_update
+from .models import Quote, QuoteGroup, QuoteLine, QuoteTracking, QuoteTrackingGroup, QuoteTrackingLine
+
+
+@transaction.atomic
+def clone_quote_to_tracking(quote, batch_size=1000, **tracking_fields):
+    """
+    Crée un QuoteTracking à partir du devis (BL / facture) en copiant ses groupes et ses lignes.
+
+    Groupes et lignes sont insérés en masse (bulk_create) et les lignes sont rattachées
+    aux groupes du tracking en mémoire : le coût ne dépend plus du nombre de lignes.
+    """
+    tracking = QuoteTracking.objects.create(quote=quote, **tracking_fields)
+
+    # Copy groups from the original quote
+    quote_groups = list(quote.groups.values_list('id', 'name', 'order'))
+    tracking_groups = QuoteTrackingGroup.objects.bulk_create([
+        QuoteTrackingGroup(tracking=tracking, name=name, order=order)
+        for _, name, order in quote_groups
+    ])
+    group_mapping = {group_id: tracking_group for (group_id, _, _), tracking_group in zip(quote_groups, tracking_groups)}
+
+    # Copy lines, maintaining group associations
+    lines = quote.lines.order_by('id').values_list('group_id', 'designation', 'quantite', 'prix_unitaire')
+    QuoteTrackingLine.objects.bulk_create([
+        QuoteTrackingLine(
+            tracking=tracking,
+            group=group_mapping.get(group_id),
+            designation=designation,
+            quantite=quantite,
+            prix_unitaire=prix_unitaire,
+            montant_ht=quantite * prix_unitaire,
+        )
+        for group_id, designation, quantite, prix_unitaire in lines
+    ], batch_size=batch_size)
+    return tracking
+
+
+def copy_number(numero_devis):
+    """Premier numéro libre de la forme <numéro>-COPIE, <numéro>-COPIE-2, ..."""
+    base = f"{numero_devis}-COPIE"[:50]
+    taken = set(Quote.objects.filter(numero_devis__startswith=base).values_list('numero_devis', flat=True))
+    candidate, index = base, 1
+    while candidate in taken:
+        index += 1
+        suffix = f"-{index}"
+        candidate = base[:50 - len(suffix)] + suffix
+    return candidate
+
+
+@transaction.atomic
+def duplicate_quote(quote, numero_devis=None, batch_size=1000, **overrides):
+    """
+    Crée un nouveau devis à partir de `quote` en copiant ses groupes et ses lignes.
+
+    overrides: champs du devis à remplacer (project, remise, ...). Groupes et lignes sont
+    insérés en masse, sans suivi de modification, et les totaux calculés une seule fois.
+    """
+    fields = {
+        'objet': quote.objet,
+        'date_livraison': quote.date_livraison,
+        'tva': quote.tva,
+        'remise': quote.remise,
+        'project': quote.project,
+    }
+    fields.update({name: value for name, value in overrides.items() if value is not None})
+    new_quote = Quote.objects.create(numero_devis=numero_devis or copy_number(quote.numero_devis), **fields)
+
+    quote_groups = list(quote.groups.values_list('id', 'name', 'order'))
+    new_groups = QuoteGroup.objects.bulk_create([
+        QuoteGroup(quote=new_quote, name=name, order=order)
+        for _, name, order in quote_groups
+    ])
+    group_mapping = {group_id: new_group for (group_id, _, _), new_group in zip(quote_groups, new_groups)}
+
+    lines = quote.lines.order_by('id').values_list('group_id', 'designation', 'quantite', 'prix_unitaire')
+    new_lines = QuoteLine.objects.bulk_create([
+        QuoteLine(
+            quote=new_quote,
+            group=group_mapping.get(group_id),
+            designation=designation,
+            quantite=quantite,
+            prix_unitaire=prix_unitaire,
+            montant_ht=quantite * prix_unitaire,
+        )
+        for group_id, designation, quantite, prix_unitaire in lines
+    ], batch_size=batch_size)
+
+    schedule_update(added=[line.catalog_values() for line in new_lines])
+    new_quote.update_totals()
+    return new_quote
+
+
+# Valeurs d'une ligne sans suivi de modification (QuoteLine / QuoteTrackingLine)
+TRACKING_RESET_VALUES = {
+    'change_status': 'unchanged',
+    'original_designation': None,
+    'original_quantite': None,
+    'original_prix_unitaire': None,
+}
+
+
+def reset_change_tracking(lines):
+    """
+    Réinitialise le suivi des modifications d'un queryset de lignes en un seul UPDATE.
+
+    Les hooks save() des lignes sont volontairement contournés : seuls les champs de
+    suivi changent, les montants et les totaux du devis restent inchangés.
+    """
+    return lines.update(**TRACKING_RESET_VALUES)
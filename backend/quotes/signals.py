@@ -0,0 +1,16 @@
+"""
+Retrait des lignes de devis supprimées du catalogue des désignations (voir quotes/catalog.py).
+
+post_delete est aussi envoyé pour les suppressions en cascade (devis, projet) et les
+suppressions par queryset, que les surcharges de delete() ne voient pas.
+"""
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .catalog import schedule_update
+from .models import QuoteLine
+
+
+@receiver(post_delete, sender=QuoteLine, dispatch_uid='quotes_catalog_line_deleted')
+def remove_from_catalog(sender, instance, **kwargs):
+    schedule_update(removed=[instance.catalog_values()])
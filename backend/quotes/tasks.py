@@ -1,16 +1,41 @@
 from celery import shared_task
-from .models import Quote
-# import weasyprint # Uncomment when installed and needed
+from documents.services import replace_project_document
+from . import catalog
+from .models import Quote, QuoteTracking
+from .pdf import render_document, quote_fingerprint
+
+
+@shared_task(bind=True)
+def generate_quote_pdf(self, quote_id, kind='quote', tracking_id=None):
+    """Rend un devis, un BL ou une facture et l'attache aux documents du projet"""
+    self.update_state(state='PROGRESS', meta={'progress': 10, 'step': 'loading'})
+    quote = Quote.objects.select_related('project__client').get(pk=quote_id)
+    tracking = QuoteTracking.objects.get(pk=tracking_id) if tracking_id else None
+
+    self.update_state(state='PROGRESS', meta={'progress': 30, 'step': 'rendering'})
+    fingerprint = quote_fingerprint(quote) if kind == 'quote' else None
+    pdf_content, file_name, document_name = render_document(kind, quote, tracking)
+
+    self.update_state(state='PROGRESS', meta={'progress': 80, 'step': 'storing'})
+    document = replace_project_document(quote.project, document_name, file_name, pdf_content, fingerprint=fingerprint)
+
+    return {
+        'document_id': document.pk,
+        'file_url': document.file_url.url,
+        'file_name': file_name,
+        'size': len(pdf_content),
+    }
+
+
+@shared_task
+def refresh_quote_catalog(designations):
+    """Recalcule les entrées du catalogue des désignations données (voir quotes/catalog.py)"""
+    catalog.refresh(designations)
+    return {'designations': len(designations)}
+
 
 @shared_task
-def generate_quote_pdf(quote_id):
-    try:
-        quote = Quote.objects.get(id=quote_id)
-        # Logic to generate PDF
-        # html = render_to_string('quotes/pdf_template.html', {'quote': quote})
-        # pdf = weasyprint.HTML(string=html).write_pdf()
-        # Save pdf to storage and update quote or send email
-        print(f"Generating PDF for quote {quote_id}")
-        return f"PDF generated for quote {quote_id}"
-    except Quote.DoesNotExist:
-        return "Quote not found"
+def refresh_catalog_medians(designations):
+    """Recalcule la médiane des prix des désignations données (voir quotes/catalog.py)"""
+    catalog.refresh_medians(designations)
+    return {'designations': len(designations)}
@@ -23,6 +23,15 @@ interface QuoteLine {
   original_prix_unitaire?: number;
 }
 
+interface CatalogItem {
+  designation: string;
+  usage_count: number;
+  last_price: string;
+  median_price: string;
+  min_price: string;
+  max_price: string;
+}
+
 interface QuoteLinesModalProps {
   quoteId: number;
   isOpen: boolean;
@@ -38,6 +47,7 @@ export const QuoteLinesModal = ({ quoteId, isOpen, onClose }: QuoteLinesModalPro
     group: '' as string | number // Empty string for "No Group"
   });
   const [newGroupName, setNewGroupName] = useState('');
+  const [showSuggestions, setShowSuggestions] = useState(false);
   const [showGroupInput, setShowGroupInput] = useState(false);
   const [editingLine, setEditingLine] = useState<QuoteLine | null>(null);
 
@@ -83,6 +93,22 @@ export const QuoteLinesModal = ({ quoteId, isOpen, onClose }: QuoteLinesModalPro
     { enabled: isOpen && !!quoteId }
   );
 
+  // Autocomplétion des désignations déjà utilisées (catalogue)
+  const catalogTerm = newLine.designation.trim();
+  const { data: suggestions = [] } = useQuery<CatalogItem[]>(
+    ['quoteCatalog', catalogTerm],
+    async () => {
+      const response = await api.get('/quotes/lines/catalog/', { params: { q: catalogTerm, limit: 8 } });
+      return response.data;
+    },
+    { enabled: isOpen && showSuggestions && catalogTerm.length >= 2, staleTime: 60000, keepPreviousData: true }
+  );
+
+  const applySuggestion = (item: CatalogItem) => {
+    setNewLine({ ...newLine, designation: item.designation, prix_unitaire: Number(item.last_price) });
+    setShowSuggestions(false);
+  };
+
   const isLoading = isLoadingLines || isLoadingGroups;
 
   // Mutations
@@ -399,16 +425,34 @@ export const QuoteLinesModal = ({ quoteId, isOpen, onClose }: QuoteLinesModalPro
             </h3>
             <form onSubmit={handleAddLine}>
               <div className="grid grid-cols-1 md:grid-cols-12 gap-4 items-end">
-                <div className="md:col-span-4">
+                <div className="md:col-span-4 relative">
                   <label className="block text-xs font-medium text-gray-700 mb-1">Désignation</label>
                   <textarea
                     value={newLine.designation}
-                    onChange={(e) => setNewLine({ ...newLine, designation: e.target.value })}
+                    onChange={(e) => { setNewLine({ ...newLine, designation: e.target.value }); setShowSuggestions(true); }}
+                    onBlur={() => setShowSuggestions(false)}
                     className="w-full p-2 border rounded focus:ring-2 focus:ring-blue-500 text-sm resize-y min-h-[60px]"
                     placeholder="Ex: Câble réseau...\nVous pouvez saisir du texte sur plusieurs lignes"
                     required
                     rows={2}
                   />
+                  {showSuggestions && catalogTerm.length >= 2 && suggestions.length > 0 && (
+                    <ul className="absolute z-10 left-0 right-0 mt-1 bg-white border rounded shadow-lg max-h-64 overflow-y-auto text-sm">
+                      {suggestions.map(item => (
+                        <li
+                          key={item.designation}
+                          onMouseDown={(e) => { e.preventDefault(); applySuggestion(item); }}
+                          className="px-3 py-2 cursor-pointer hover:bg-blue-50"
+                        >
+                          <div className="text-gray-800">{item.designation}</div>
+                          <div className="text-xs text-gray-500">
+                            Dernier : {Number(item.last_price).toFixed(2)} DH · Médian : {Number(item.median_price).toFixed(2)} DH
+                            · {Number(item.min_price).toFixed(2)} – {Number(item.max_price).toFixed(2)} DH · {item.usage_count} utilisation(s)
+                          </div>
+                        </li>
+                      ))}
+                    </ul>
+                  )}
                 </div>
                 <div className="md:col-span-3">
                   <label className="block text-xs font-medium text-gray-700 mb-1">Groupe (Optionnel)</label>
@@ -1,6 +1,6 @@
 import { useState } from 'react';
 import { useQuery, useMutation, useQueryClient } from 'react-query';
-import { FileText, List, Search } from 'lucide-react';
+import { Copy, FileText, List, Search } from 'lucide-react';
 import api from '../api/axios';
 import { DataTable } from '../components/DataTable';
 import { QuoteLinesModal } from '../components/QuoteLinesModal';
@@ -96,6 +96,20 @@ export const Quotes = () => {
     }
   );
 
+  // Duplicate Quote (copie côté serveur des groupes et lignes)
+  const duplicateMutation = useMutation(
+    (id: number) => api.post(`/quotes/${id}/duplicate/`, {}),
+    {
+      onSuccess: () => {
+        queryClient.invalidateQueries('quotes');
+      },
+      onError: (err: any) => {
+        console.error("Duplicate error:", err);
+        alert('Une erreur est survenue lors de la duplication du devis.');
+      }
+    }
+  );
+
   const handleSubmit = (e: React.FormEvent) => {
     e.preventDefault();
     setError(null);
@@ -212,6 +226,14 @@ export const Quotes = () => {
             >
               <List className="w-4 h-4" />
             </button>
+            <button
+              onClick={() => duplicateMutation.mutate(quote.id_quote)}
+              disabled={duplicateMutation.isLoading}
+              className="p-1 text-blue-600 hover:bg-blue-50 rounded disabled:opacity-50"
+              title="Dupliquer le devis"
+            >
+              <Copy className="w-4 h-4" />
+            </button>
             <button
               onClick={() => handleDownloadPdf(quote)}
               className="p-1 text-purple-600 hover:bg-purple-50 rounded"